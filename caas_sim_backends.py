@@ -0,0 +1,596 @@
+import functools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# ortools takes longer to import than most runs take to solve, so every backend imports the part it uses
+
+# Preferences are in [0, 1]; integer solvers (CP-SAT, min cost flow) see them multiplied by this
+PREFERENCE_SCALE = 1000000
+# Largest power of ten CP-SAT scales fractional demands and capacities by to make them integers
+MAX_CAPACITY_SCALE = 1000000
+# CP-SAT's portfolio search needs several workers to be effective, even on hosts with few cores
+MIN_CPSAT_WORKERS = 8
+# Instances with more virtual satellites than this are solved by the greedy heuristic when the backend is "auto"
+GREEDY_MIN_VIRTUAL = 5000
+
+OPTIMAL = 'OPTIMAL'
+FEASIBLE = 'FEASIBLE'
+INFEASIBLE = 'INFEASIBLE'
+NOT_SOLVED = 'NOT_SOLVED'
+
+
+class SolveResult:
+	"""
+	The outcome of solving an assignment model, the same for every backend.
+
+	Attributes:
+	    backend (str): Name of the backend that produced the result.
+	    status (str): One of OPTIMAL, FEASIBLE, INFEASIBLE or NOT_SOLVED.
+	    assignment (dict): {virtual index: physical index} for every assigned virtual satellite.
+	    objective (float): Total preference of the assignment.
+	    build_time (float): Time spent handing the model to the backend, in milliseconds.
+	    solve_time (float): Time spent solving, in milliseconds.
+	    bound (float): Best known upper bound on the objective, None if the backend does not prove one.
+	    incumbents (list): (milliseconds into the solve, objective, bound) of every improving assignment found.
+	"""
+
+	def __init__(self, backend, status, assignment, objective, build_time, solve_time, bound=None, incumbents=None):
+		self.backend = backend
+		self.status = status
+		self.assignment = assignment
+		self.objective = objective
+		self.build_time = build_time
+		self.solve_time = solve_time
+		self.bound = bound
+		self.incumbents = incumbents or []
+
+	@property
+	def found(self):
+		return self.status in (OPTIMAL, FEASIBLE)
+
+	@property
+	def gap(self):
+		"""
+		Relative gap between the objective and the bound, None without a bound.
+		"""
+		if self.bound is None or not self.found:
+			return None
+		return abs(self.bound - self.objective) / max(abs(self.objective), 1e-9)
+
+
+class IncumbentReporter:
+	"""
+	Records every improving assignment a backend finds during a solve and hands it to an optional 
+	on_incumbent callback as a FEASIBLE SolveResult, so long runs yield usable assignments early.
+	"""
+
+	def __init__(self, backend, on_incumbent=None):
+		self.backend = backend
+		self.on_incumbent = on_incumbent
+		self.incumbents = []
+		self.start = time.perf_counter()
+
+	def report(self, assignment, objective, bound=None):
+		elapsed = (time.perf_counter() - self.start) * 1000
+		self.incumbents.append((elapsed, objective, bound))
+		if self.on_incumbent is not None:
+			self.on_incumbent(SolveResult(self.backend, FEASIBLE, assignment, objective, 0.0, elapsed, bound))
+
+
+@functools.lru_cache(maxsize=None)
+def cpsat_incumbent_callback():
+	"""
+	Returns the CP-SAT solution callback class that reports every solution CP-SAT finds to an 
+	IncumbentReporter, defined on first use since it subclasses an ortools class.
+	"""
+	from ortools.sat.python import cp_model
+
+	class CpSatIncumbentCallback(cp_model.CpSolverSolutionCallback):
+
+		def __init__(self, reporter, x_vars, pair_virtual, pair_physical):
+			cp_model.CpSolverSolutionCallback.__init__(self)
+			self.reporter = reporter
+			self.x_vars = x_vars
+			self.pair_virtual = pair_virtual
+			self.pair_physical = pair_physical
+
+		def OnSolutionCallback(self):
+			assignment = {i: j for var, i, j in zip(self.x_vars, self.pair_virtual, self.pair_physical)
+				      if self.BooleanValue(var)}
+			self.reporter.report(assignment, self.ObjectiveValue() / PREFERENCE_SCALE,
+					     self.BestObjectiveBound() / PREFERENCE_SCALE)
+
+	return CpSatIncumbentCallback
+
+
+def solve(model, backend='scip', **options):
+	"""
+	Solves an assignment model with the chosen backend.
+
+	Parameters:
+	    model (AssignmentModel): The model to solve, see caas_sim_solver.AssignmentModel.
+	    backend (str): One of the names in BACKENDS, or "auto" to pick one from the size and shape of the model.
+	    options: Backend options. Every backend accepts, and ignores the ones it cannot use:
+	             - hint: a previous {virtual index: physical index} assignment to start from.
+	             - time_limit: seconds after which to stop and return the best assignment found so far.
+	             - relative_gap: relative distance to the bound at which an assignment is good enough.
+	             - on_incumbent: a function called with a FEASIBLE SolveResult for every improving assignment.
+
+	Returns:
+	    SolveResult: The result of the backend.
+	"""
+	if backend == 'auto':
+		backend = select_backend(model)
+	if backend not in BACKENDS:
+		raise ValueError(f"Unknown solver backend {backend}. Expected one of {', '.join(BACKENDS)} or auto.")
+	return BACKENDS[backend](model, **options)
+
+
+def select_backend(model):
+	"""
+	Picks the fastest backend expected to give a good assignment: min cost flow when it is exact,
+	the greedy heuristic for very large instances, and SCIP otherwise.
+	"""
+	if flow_capacity_field(model) is not None:
+		return 'flow'
+	if model.num_virtual > GREEDY_MIN_VIRTUAL:
+		return 'greedy'
+	return 'scip'
+
+
+def assignment_objective(model, assignment):
+	"""
+	Returns the total preference of an assignment of the model.
+	"""
+	pair_index = {(i, j): k for k, (i, j) in enumerate(zip(model.pair_virtual.tolist(), model.pair_physical.tolist()))}
+	return float(sum(model.preference[pair_index[i, j]] for i, j in assignment.items()))
+
+
+def solve_scip(model, hint=None, time_limit=None, relative_gap=None, on_incumbent=None):
+	"""
+	Solves the model exactly as a mixed integer program with SCIP. The pywraplp interface has no 
+	solution callback, so on_incumbent only receives the final assignment.
+	"""
+	from ortools.linear_solver import pywraplp
+
+	build_start = time.perf_counter()
+	solver = pywraplp.Solver.CreateSolver("SCIP")
+	x = model.build_mip(solver)
+	if hint:
+		solver.SetHint(list(x.values()), [float(hint.get(i) == j) for (i, j) in x])
+	if time_limit is not None:
+		solver.SetTimeLimit(int(time_limit * 1000))
+	params = pywraplp.MPSolverParameters()
+	if relative_gap is not None:
+		params.SetDoubleParam(params.RELATIVE_MIP_GAP, relative_gap)
+	build_time = (time.perf_counter() - build_start) * 1000
+
+	reporter = IncumbentReporter('scip', on_incumbent)
+	status = solver.Solve(params)
+	solve_time = (time.perf_counter() - reporter.start) * 1000
+
+	if status in (pywraplp.Solver.OPTIMAL, pywraplp.Solver.FEASIBLE):
+		assignment = {i: j for (i, j), var in x.items() if var.solution_value() > 0.5}
+		objective, bound = solver.Objective().Value(), solver.Objective().BestBound()
+		reporter.report(assignment, objective, bound)
+		return SolveResult('scip', OPTIMAL if status == pywraplp.Solver.OPTIMAL else FEASIBLE, assignment,
+				   objective, build_time, solve_time, bound, reporter.incumbents)
+	return SolveResult('scip', INFEASIBLE if status == pywraplp.Solver.INFEASIBLE else NOT_SOLVED, {},
+			   0.0, build_time, solve_time)
+
+
+def integer_capacities(demand, capacity):
+	"""
+	Scales the demands and capacities of one field to integers, as CP-SAT requires, by the smallest power 
+	of ten up to MAX_CAPACITY_SCALE that makes them exact. Past that, demands are rounded up and capacities 
+	down, so every integer solution still fits the real capacities.
+
+	Parameters:
+	    demand (numpy.ndarray): The demand of every virtual satellite.
+	    capacity (numpy.ndarray): The capacity of every physical satellite, inf where unconstrained.
+
+	Returns:
+	    tuple: The scaled demands and capacities. Infinite capacities stay infinite.
+	"""
+	values = np.concatenate((demand, capacity[np.isfinite(capacity)]))
+	scale = 1
+	while scale < MAX_CAPACITY_SCALE and not np.all(values * scale == np.round(values * scale)):
+		scale *= 10
+	return (np.ceil(demand * scale - 1e-9).astype(np.int64),
+		np.floor(capacity * scale + 1e-9))
+
+
+def solve_cpsat(model, hint=None, num_workers=None, time_limit=None, relative_gap=None, on_incumbent=None):
+	"""
+	Solves the model with the CP-SAT solver. The formulation matches the MIP: one boolean per candidate pair 
+	(pairs lacking a required capability are not in the model), exactly one pair per virtual satellite, and 
+	one capacity row per physical satellite and field that can bind. Preferences are scaled to integers by 
+	PREFERENCE_SCALE, demands and capacities by integer_capacities.
+
+	Parameters:
+	    model (AssignmentModel): The model to solve.
+	    hint (dict): A previous {virtual index: physical index} assignment to start the search from.
+	    num_workers (int): Number of parallel search workers, one per core (at least MIN_CPSAT_WORKERS) if None.
+	    time_limit (float): Stop after this many seconds and return the best assignment found, if any.
+	    relative_gap (float): Stop once the best assignment is within this fraction of the best bound.
+	    on_incumbent (function): Called with a FEASIBLE SolveResult for every improving assignment found.
+
+	Returns:
+	    SolveResult: OPTIMAL, FEASIBLE when stopped by a limit with an assignment, INFEASIBLE or NOT_SOLVED.
+	"""
+	from ortools.sat.python import cp_model
+
+	build_start = time.perf_counter()
+	pair_virtual = model.pair_virtual.tolist()
+	pair_physical = model.pair_physical.tolist()
+	cp = cp_model.CpModel()
+	x_vars = [cp.NewBoolVar("x_%i_%i" % (i, j)) for i, j in zip(pair_virtual, pair_physical)]
+
+	# Each virtual satellite must be assigned to exactly one physical satellite.
+	for i in range(model.num_virtual):
+		cp.AddExactlyOne([x_vars[k] for k in model.virtual_cols[model.virtual_ptr[i]:model.virtual_ptr[i + 1]].tolist()])
+
+	# Ensures that the demand does not exceed physical satellites capabilities.
+	for f in range(len(model.fields)):
+		demand, capacity = integer_capacities(model.demand[f], model.capacity[f])
+		coefficients = demand[model.pair_virtual]
+		for j in np.flatnonzero(model.max_load(f) > model.capacity[f]).tolist():
+			cols = [k for k in model.physical_cols[model.physical_ptr[j]:model.physical_ptr[j + 1]].tolist()
+				if coefficients[k]]
+			cp.Add(cp_model.LinearExpr.WeightedSum([x_vars[k] for k in cols], [int(coefficients[k]) for k in cols])
+			       <= int(capacity[j]))
+
+	# Objective: Maximize the total preference score for the assignments.
+	weights = np.rint(model.preference * PREFERENCE_SCALE).astype(np.int64).tolist()
+	cp.Maximize(cp_model.LinearExpr.WeightedSum(x_vars, weights))
+	if hint:
+		for var, i, j in zip(x_vars, pair_virtual, pair_physical):
+			cp.AddHint(var, hint.get(i) == j)
+
+	cp_solver = cp_model.CpSolver()
+	cp_solver.parameters.num_workers = num_workers or max(os.cpu_count() or 1, MIN_CPSAT_WORKERS)
+	if time_limit is not None:
+		cp_solver.parameters.max_time_in_seconds = time_limit
+	if relative_gap is not None:
+		cp_solver.parameters.relative_gap_limit = relative_gap
+	build_time = (time.perf_counter() - build_start) * 1000
+
+	reporter = IncumbentReporter('cpsat', on_incumbent)
+	status = cp_solver.Solve(cp, cpsat_incumbent_callback()(reporter, x_vars, pair_virtual, pair_physical))
+	solve_time = (time.perf_counter() - reporter.start) * 1000
+
+	if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+		assignment = {i: j for var, i, j in zip(x_vars, pair_virtual, pair_physical) if cp_solver.BooleanValue(var)}
+		return SolveResult('cpsat', OPTIMAL if status == cp_model.OPTIMAL else FEASIBLE, assignment,
+				   assignment_objective(model, assignment), build_time, solve_time,
+				   cp_solver.BestObjectiveBound() / PREFERENCE_SCALE, reporter.incumbents)
+	return SolveResult('cpsat', INFEASIBLE if status == cp_model.INFEASIBLE else NOT_SOLVED, {},
+			   0.0, build_time, solve_time)
+
+
+def flow_capacity_field(model):
+	"""
+	Checks whether the model is a min cost flow problem: at most one capacity field can bind, and
+	every virtual satellite has the same demand for it, so capacities become a number of slots.
+
+	Returns:
+	    int: The index of the binding field, -1 if no field binds, or None if the model is not a flow problem.
+	"""
+	binding = [f for f in range(len(model.fields)) if np.any(model.max_load(f) > model.capacity[f])]
+	if not binding:
+		return -1
+	if len(binding) > 1:
+		return None
+	demand = model.demand[binding[0]]
+	if len(demand) and demand[0] > 0 and np.all(demand == demand[0]):
+		return binding[0]
+	return None
+
+
+def solve_flow(model, hint=None, time_limit=None, relative_gap=None, on_incumbent=None):
+	"""
+	Solves the model exactly as a min cost flow (a capacitated Hungarian assignment). Only applies when
+	flow_capacity_field finds a single binding capacity field with uniform demand. The solve is exact 
+	and fast, so the limits are ignored and on_incumbent only receives the final assignment.
+	"""
+	field = flow_capacity_field(model)
+	if field is None:
+		raise ValueError("The flow backend needs at most one binding capacity field with the same demand "
+				 "for every virtual satellite. Use another backend for this model.")
+
+	from ortools.graph.python import min_cost_flow
+
+	build_start = time.perf_counter()
+	num_virtual, num_physical = model.num_virtual, model.num_physical
+	source, sink = 0, num_virtual + num_physical + 1
+	if field < 0:
+		slots = np.full(num_physical, num_virtual, dtype=np.int64)
+	else:
+		slots = np.minimum(np.floor(model.capacity[field] / model.demand[field, 0]), num_virtual).astype(np.int64)
+
+	# source -> virtual, virtual -> physical (one arc per pair), physical -> sink
+	start_nodes = np.concatenate((np.full(num_virtual, source), model.pair_virtual + 1,
+				      np.arange(num_physical) + num_virtual + 1))
+	end_nodes = np.concatenate((np.arange(num_virtual) + 1, model.pair_physical + num_virtual + 1,
+				    np.full(num_physical, sink)))
+	capacities = np.concatenate((np.ones(num_virtual + model.num_pairs, dtype=np.int64), slots))
+	costs = np.concatenate((np.zeros(num_virtual, dtype=np.int64),
+				-np.rint(model.preference * PREFERENCE_SCALE).astype(np.int64),
+				np.zeros(num_physical, dtype=np.int64)))
+
+	smcf = min_cost_flow.SimpleMinCostFlow()
+	arcs = smcf.add_arcs_with_capacity_and_unit_cost(start_nodes, end_nodes, capacities, costs)
+	smcf.set_nodes_supplies(np.array([source, sink]), np.array([num_virtual, -num_virtual]))
+	build_time = (time.perf_counter() - build_start) * 1000
+
+	reporter = IncumbentReporter('flow', on_incumbent)
+	status = smcf.solve()
+	solve_time = (time.perf_counter() - reporter.start) * 1000
+
+	if status != smcf.OPTIMAL:
+		return SolveResult('flow', INFEASIBLE, {}, 0.0, build_time, solve_time)
+	pair_flows = smcf.flows(arcs[num_virtual:num_virtual + model.num_pairs])
+	assignment = {model.pair_virtual[k].item(): model.pair_physical[k].item() for k in np.flatnonzero(pair_flows)}
+	objective = assignment_objective(model, assignment)
+	reporter.report(assignment, objective, objective)
+	return SolveResult('flow', OPTIMAL, assignment, objective, build_time, solve_time, objective, reporter.incumbents)
+
+
+def solve_greedy(model, hint=None, time_limit=None, relative_gap=None, on_incumbent=None, max_passes=10):
+	"""
+	Finds a good assignment quickly without optimality guarantee. Virtual satellites are placed on
+	their most preferred physical satellite with room left, best pairs first. The ones left without 
+	room are placed along an ejection chain (see repair), and virtual satellites are then moved one at 
+	a time to more preferred physical satellites with room for up to max_passes passes, or until 
+	time_limit seconds have passed. Starts from the hint, where it still fits, if one is given.
+	on_incumbent receives the constructed assignment and every improvement of the local search.
+	"""
+	build_start = time.perf_counter()
+	pair_virtual = model.pair_virtual.tolist()
+	pair_physical = model.pair_physical.tolist()
+	preference = model.preference.tolist()
+	demand = model.demand.T
+	residual = model.capacity.T.copy()
+	build_time = (time.perf_counter() - build_start) * 1000
+
+	reporter = IncumbentReporter('greedy', on_incumbent)
+	assigned = {}
+
+	def current():
+		assignment = {i: pair_physical[k] for i, k in sorted(assigned.items())}
+		return assignment, float(sum(preference[k] for k in assigned.values()))
+
+	def place(k):
+		i, j = pair_virtual[k], pair_physical[k]
+		if np.all(residual[j] >= demand[i]):
+			residual[j] -= demand[i]
+			assigned[i] = k
+			return True
+		return False
+
+	if hint:
+		pair_of = {(i, j): k for k, (i, j) in enumerate(zip(pair_virtual, pair_physical))}
+		for i, j in hint.items():
+			if (i, j) in pair_of:
+				place(pair_of[i, j])
+
+	for k in np.argsort(-model.preference, kind='stable').tolist():
+		if pair_virtual[k] not in assigned:
+			place(k)
+
+	occupants = [set() for _ in range(model.num_physical)]
+	for i, k in assigned.items():
+		occupants[pair_physical[k]].add(i)
+
+	def repair(u):
+		"""
+		Places virtual satellite u along an ejection chain: u takes a physical satellite, evicting an
+		occupant if there is no room, which takes another physical satellite, and so on until one has
+		room. Chains are searched breadth first, visiting every physical satellite once, so with a single
+		binding capacity and equal demands this finds a place for u whenever an assignment exists.
+		"""
+		came = {u: None}  # evicted virtual satellite: (the one taking its place, the pair it takes)
+		queue = [u]
+		seen = set()
+		for w in queue:
+			cols = model.virtual_cols[model.virtual_ptr[w]:model.virtual_ptr[w + 1]].tolist()
+			for k in sorted(cols, key=lambda k: -preference[k]):
+				j = pair_physical[k]
+				if j in seen:
+					continue
+				seen.add(j)
+				if np.all(residual[j] >= demand[w]):
+					chain = [(w, k)]
+					while came[chain[-1][0]] is not None:
+						chain.append(came[chain[-1][0]])
+					for v, _ in chain:
+						if v in assigned:
+							residual[pair_physical[assigned[v]]] += demand[v]
+							occupants[pair_physical[assigned[v]]].discard(v)
+					for v, k in chain:
+						residual[pair_physical[k]] -= demand[v]
+						occupants[pair_physical[k]].add(v)
+						assigned[v] = k
+					return True
+				for v in occupants[j]:
+					if v not in came and np.all(residual[j] + demand[v] >= demand[w]):
+						came[v] = (w, k)
+						queue.append(v)
+		return False
+
+	for u in range(model.num_virtual):
+		if time_limit is not None and time.perf_counter() - reporter.start > time_limit:
+			break
+		if u not in assigned:
+			repair(u)
+	if len(assigned) == model.num_virtual:
+		reporter.report(*current())
+
+	# Local search: move a virtual satellite to a more preferred physical satellite with room for it
+	for _ in range(max_passes):
+		if time_limit is not None and time.perf_counter() - reporter.start > time_limit:
+			break
+		improved = False
+		for i, cur in list(assigned.items()):
+			cols = model.virtual_cols[model.virtual_ptr[i]:model.virtual_ptr[i + 1]].tolist()
+			for k in sorted(cols, key=lambda k: -preference[k]):
+				if preference[k] <= preference[cur]:
+					break
+				residual[pair_physical[cur]] += demand[i]
+				if place(k):
+					improved = True
+					break
+				residual[pair_physical[cur]] -= demand[i]
+		if not improved:
+			break
+		if len(assigned) == model.num_virtual:
+			reporter.report(*current())
+	solve_time = (time.perf_counter() - reporter.start) * 1000
+
+	if len(assigned) < model.num_virtual:
+		# Like the other backends, no assignment unless every virtual satellite is placed
+		return SolveResult('greedy', NOT_SOLVED, {}, 0.0, build_time, solve_time, incumbents=reporter.incumbents)
+	assignment, objective = current()
+	return SolveResult('greedy', FEASIBLE, assignment, objective, build_time, solve_time,
+			   incumbents=reporter.incumbents)
+
+
+def component_labels(model):
+	"""
+	Labels the satellites with the connected component of the pair graph they belong to. Components
+	share no pair, so solving each of them separately and joining the assignments solves the model.
+
+	Parameters:
+	    model (AssignmentModel): The model to split.
+
+	Returns:
+	    tuple: The component label of every virtual and of every physical satellite.
+	"""
+	# Minimum label propagation along the pairs, with pointer jumping, over virtual then physical nodes
+	labels = np.arange(model.num_virtual + model.num_physical)
+	u, v = model.pair_virtual, model.pair_physical + model.num_virtual
+	while True:
+		previous = labels.copy()
+		lowest = np.minimum(labels[u], labels[v])
+		np.minimum.at(labels, u, lowest)
+		np.minimum.at(labels, v, lowest)
+		labels = labels[labels]
+		if np.array_equal(labels, previous):
+			return labels[:model.num_virtual], labels[model.num_virtual:]
+
+
+def group_by(labels):
+	"""
+	Groups indices by label.
+
+	Parameters:
+	    labels (numpy.ndarray): The label of every index.
+
+	Returns:
+	    tuple: The sorted distinct labels, and for each of them the increasing indices with that label.
+	"""
+	order = np.argsort(labels, kind='stable')
+	distinct, starts = np.unique(labels[order], return_index=True)
+	return distinct.tolist(), np.split(order, starts[1:])
+
+
+def solve_decomposed(model, virtual_labels, physical_labels, backend='scip', processes=None, exact=True, **options):
+	"""
+	Solves a model split into parts, one per label, in a pool of worker processes and joins the results. 
+	Pairs between satellites of different parts are dropped. Unless the split is exact, the virtual
+	satellites of parts without a solution are solved once more against the capacity the other parts 
+	left on every physical satellite.
+
+	Parameters:
+	    model (AssignmentModel): The model to solve.
+	    virtual_labels (numpy.ndarray): The part of every virtual satellite.
+	    physical_labels (numpy.ndarray): The part of every physical satellite.
+	    backend (str): The backend each part is solved with, see solve.
+	    processes (int): Number of worker processes, all CPUs if None. Parts are solved in this process if 1.
+	    exact (bool): Whether the parts share no pair, so optimal parts make an optimal assignment.
+	    options: Options passed on to the backend of every part. hint is split between the parts, and 
+	             on_incumbent only receives the joined assignment since the parts are solved elsewhere.
+
+	Returns:
+	    SolveResult: The joined result.
+	"""
+	on_incumbent = options.pop('on_incumbent', None)
+	hint = options.pop('hint', None) or {}
+	build_start = time.perf_counter()
+	# Group satellites and the pairs within a part by label in one pass, rather than one pass per part
+	labels, virtual_groups = group_by(virtual_labels)
+	physical_groups = dict(zip(*group_by(physical_labels)))
+	pair_labels = virtual_labels[model.pair_virtual]
+	inside = np.flatnonzero(pair_labels == physical_labels[model.pair_physical])
+	column_groups = dict(zip(*group_by(pair_labels[inside])))
+	hint_groups = {}
+	for i, j in hint.items():
+		if virtual_labels[i] == physical_labels[j]:
+			hint_groups.setdefault(virtual_labels[i].item(), {})[i] = j
+	parts = []
+	for label, virtual in zip(labels, virtual_groups):
+		physical = physical_groups.get(label, np.zeros(0, dtype=np.int64))
+		columns = inside[column_groups.get(label, np.zeros(0, dtype=np.int64))]
+		part_hint = {int(np.searchsorted(virtual, i)): int(np.searchsorted(physical, j))
+			     for i, j in hint_groups.get(label, {}).items()}
+		parts.append((virtual, physical, model.subset(virtual, physical, columns), part_hint))
+	# Largest parts first, so they do not end up last on a busy pool
+	parts.sort(key=lambda part: -part[2].num_pairs)
+	build_time = (time.perf_counter() - build_start) * 1000
+
+	solve_start = time.perf_counter()
+	if processes == 1 or len(parts) <= 1:
+		results = [solve(sub, backend, hint=part_hint, **options) for _, _, sub, part_hint in parts]
+	else:
+		with ProcessPoolExecutor(max_workers=processes) as pool:
+			futures = [pool.submit(solve, sub, backend, hint=part_hint, **options) for _, _, sub, part_hint in parts]
+			results = [future.result() for future in futures]
+	solve_time = (time.perf_counter() - solve_start) * 1000
+
+	# Only parts with a solution are kept, the others are solved again below (or make the result fail)
+	assignment = {}
+	for (virtual, physical, _, _), result in zip(parts, results):
+		if result.found:
+			assignment.update({virtual[i].item(): physical[j].item() for i, j in result.assignment.items()})
+
+	failed = [virtual for (virtual, _, _, _), result in zip(parts, results) if not result.found]
+	if failed and not exact:
+		repair_start = time.perf_counter()
+		virtual = np.sort(np.concatenate(failed))
+		sub = model.subset(virtual, np.arange(model.num_physical))
+		assigned = np.array(list(assignment.items()), dtype=np.int64).reshape(-1, 2)
+		for f in range(len(model.fields)):
+			sub.capacity[f] -= np.bincount(assigned[:, 1], weights=model.demand[f, assigned[:, 0]],
+						       minlength=model.num_physical)
+		results.append(solve(sub, backend, **options))
+		assignment.update({virtual[i].item(): j for i, j in results[-1].assignment.items()})
+		# The repair result is last, and counted once whether or not it found a solution
+		results = [result for result in results[:-1] if result.found] + results[-1:]
+		solve_time += (time.perf_counter() - repair_start) * 1000
+
+	backends = ','.join(sorted({result.backend for result in results})) or backend
+	build_time += sum(result.build_time for result in results)
+	if not all(result.found for result in results):
+		status = INFEASIBLE if exact and any(result.status == INFEASIBLE for result in results) else NOT_SOLVED
+		return SolveResult(backends, status, {}, 0.0, build_time, solve_time)
+
+	objective = assignment_objective(model, assignment)
+	status = OPTIMAL if exact and all(result.status == OPTIMAL for result in results) else FEASIBLE
+	bound = None
+	if exact and all(result.bound is not None for result in results):
+		bound = sum(result.bound for result in results)
+	if on_incumbent is not None:
+		on_incumbent(SolveResult(backends, FEASIBLE, assignment, objective, build_time, solve_time, bound))
+	return SolveResult(backends, status, assignment, objective, build_time, solve_time, bound,
+			   [(solve_time, objective, bound)])
+
+
+BACKENDS = {
+	'scip': solve_scip,
+	'cpsat': solve_cpsat,
+	'flow': solve_flow,
+	'greedy': solve_greedy,
+}
@@ -0,0 +1,181 @@
+import argparse
+import math
+import sys
+
+import numpy as np
+
+try:
+	from .caas_sim_tle import stream_tle_file
+except (ImportError, SystemError):
+	from caas_sim_tle import stream_tle_file
+
+# WGS84 gravitational parameter (km^3/s^2) and equatorial radius (km), for the altitudes of the orbits
+EARTH_MU_KM = 398600.4418
+EARTH_RADIUS_KM = 6378.137
+
+# Columns a catalog can be filtered and sorted by
+FILTER_COLUMNS = ('norad', 'inclination', 'raan', 'altitude')
+
+
+def orbit_altitude(mean_motion):
+	"""
+	Returns the mean altitude of orbits above the equator, from their mean motion.
+
+	Args:
+		mean_motion (numpy.ndarray): The mean motions in revolutions per day.
+
+	Returns:
+		numpy.ndarray: The altitudes in km.
+	"""
+	radians_per_second = np.asarray(mean_motion) * 2 * math.pi / 86400.0
+	return np.cbrt(EARTH_MU_KM / radians_per_second ** 2) - EARTH_RADIUS_KM
+
+
+def parse_range(text):
+	"""
+	Parses a MIN:MAX range of a command line filter. Either bound can be left out, and a single value selects
+	exactly that value.
+
+	Returns:
+		tuple: The inclusive lower and upper bound.
+	"""
+	low, separator, high = text.partition(':')
+	if not separator:
+		high = low
+	try:
+		return float(low) if low.strip() else -math.inf, float(high) if high.strip() else math.inf
+	except ValueError:
+		raise argparse.ArgumentTypeError('%r is not a MIN:MAX range' % text)
+
+
+class TleIndex:
+	"""
+	An index of TLE catalogs for selecting satellites by ranges of FILTER_COLUMNS.
+
+	The catalogs are streamed once to collect the columns, and every column is sorted once, on first use, so
+	each range is then selected with a binary search instead of a scan of the catalog.
+
+	Attributes:
+	    tle_files (List[str]): The indexed TLE files.
+	    offsets (numpy.ndarray): Index of the first satellite of each file, followed by the number of satellites.
+	    columns (dict): One array per field of FILTER_COLUMNS, one entry per satellite.
+	"""
+
+	def __init__(self, tle_files):
+		self.tle_files = list(tle_files)
+		collected = {column: [] for column in FILTER_COLUMNS}
+		counts = [0]
+		for tle_file in self.tle_files:
+			count = 0
+			for records in stream_tle_file(tle_file):
+				collected['norad'].append(np.asarray(records['catalog'], dtype=np.int64))
+				collected['inclination'].append(np.asarray(records['inclination'], dtype=float))
+				collected['raan'].append(np.asarray(records['raan'], dtype=float))
+				collected['altitude'].append(orbit_altitude(records['mean_motion']))
+				count += len(records)
+			counts.append(count)
+		self.offsets = np.cumsum(counts)
+		self.columns = {column: np.concatenate(arrays) if arrays else np.zeros(0)
+				for column, arrays in collected.items()}
+		self.orders = {}
+
+
+	def __len__(self):
+		return int(self.offsets[-1])
+
+
+	def order(self, column):
+		"""
+		Returns the satellites sorted by a column, ties in catalog order, sorting the column on first use.
+		"""
+		if column not in self.orders:
+			self.orders[column] = np.argsort(self.columns[column], kind='stable')
+		return self.orders[column]
+
+
+	def select(self, ranges):
+		"""
+		Selects the satellites within ranges of the columns.
+
+		Args:
+			ranges (dict): Inclusive (low, high) ranges per column of FILTER_COLUMNS. A satellite is selected if
+				       it lies in any of the ranges of every column given.
+
+		Returns:
+			numpy.ndarray: The indices of the selected satellites, in catalog order.
+		"""
+		selected = np.ones(len(self), dtype=bool)
+		for column, column_ranges in ranges.items():
+			if not column_ranges:
+				continue
+			order = self.order(column)
+			values = self.columns[column][order]
+			in_ranges = np.zeros(len(self), dtype=bool)
+			for low, high in column_ranges:
+				in_ranges[order[np.searchsorted(values, low, 'left'):np.searchsorted(values, high, 'right')]] = True
+			selected &= in_ranges
+		return np.flatnonzero(selected)
+
+
+	def write(self, selected, out, sort_by=None):
+		"""
+		Writes the TLEs of selected satellites as a TLE file, one constellation as the const_setup functions
+		read it.
+
+		Args:
+			selected (numpy.ndarray): Indices of the satellites to write.
+			out (file): The file to write to.
+			sort_by (str): One of FILTER_COLUMNS to sort the satellites by, catalog order if None. The
+				       catalogs are streamed again, and only the selected TLEs are held when sorting.
+		"""
+		selected = np.unique(selected)
+		held = {}
+		for k, tle_file in enumerate(self.tle_files):
+			start = self.offsets[k]
+			for records in stream_tle_file(tle_file):
+				stop = start + len(records)
+				local = selected[np.searchsorted(selected, start):np.searchsorted(selected, stop)]
+				for index in local.tolist():
+					record = records[index - start]
+					tle = '%s\n%s\n%s\n' % (record['name'].decode(), record['line1'].decode(),
+								record['line2'].decode())
+					if sort_by is None:
+						out.write(tle)
+					else:
+						held[index] = tle
+				start = stop
+		if sort_by is not None:
+			for index in selected[np.argsort(self.columns[sort_by][selected], kind='stable')].tolist():
+				out.write(held[index])
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(
+		description='Selects satellites of TLE catalogs by orbit and writes them as a constellation TLE file. '
+			    'Ranges are MIN:MAX, inclusive, either bound optional; repeat an option to select any of '
+			    'several ranges.')
+	parser.add_argument('tle_files', nargs='+', help='TLE catalogs to filter')
+	parser.add_argument('-o', '--output', help='TLE file to write, standard output if not given')
+	parser.add_argument('--norad', type=parse_range, action='append', default=[], help='NORAD catalog numbers')
+	parser.add_argument('--inclination', type=parse_range, action='append', default=[],
+			    help='inclination (degrees)')
+	parser.add_argument('--raan', type=parse_range, action='append', default=[],
+			    help='right ascension of the ascending node (degrees)')
+	parser.add_argument('--altitude', type=parse_range, action='append', default=[],
+			    help='mean altitude above the equator (km)')
+	parser.add_argument('--sort', choices=FILTER_COLUMNS,
+			    help='column to sort the output by, catalog order if not given')
+	args = parser.parse_args(argv)
+
+	index = TleIndex(args.tle_files)
+	selected = index.select({column: getattr(args, column) for column in FILTER_COLUMNS})
+	if args.output:
+		with open(args.output, 'w') as out:
+			index.write(selected, out, args.sort)
+	else:
+		index.write(selected, sys.stdout, args.sort)
+	print('selected %d of %d satellites' % (len(selected), len(index)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+	main()
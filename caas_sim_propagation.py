@@ -0,0 +1,323 @@
+import math
+
+import ephem
+import numpy as np
+from sgp4.api import Satrec, SatrecArray, WGS72
+
+try:
+	from .caas_sim_tle import tle_epoch
+except (ImportError, SystemError):
+	from caas_sim_tle import tle_epoch
+
+# Julian date of ephem's date 0 (1899 December 31 12:00 UT) and of sgp4init's epoch 0 (1949 December 31 00:00 UT)
+EPHEM_EPOCH_JD = 2415020.0
+SGP4_EPOCH_JD = 2433281.5
+MINUTES_PER_DAY = 1440.0
+
+# WGS84 ellipsoid, for the sub-satellite points
+EARTH_RADIUS_M = 6378137.0
+EARTH_FLATTENING = 1 / 298.257223563
+
+# Elements that fully describe an SGP4 propagator, in the column order of propagator_elements
+PROPAGATOR_ELEMENTS = ('jdsatepoch', 'jdsatepochF', 'bstar', 'ndot', 'nddot', 'ecco', 'argpo', 'inclo', 'mo',
+		       'no_kozai', 'nodeo')
+
+STATE_COLUMNS = 6
+
+# Elements of an ephem.EarthSatellite that fully describe its orbit, identifying the satellites not read from a TLE
+EPHEM_ELEMENTS = ('catalog_number', '_epoch', '_inc', '_raan', '_e', '_ap', '_M', '_n', '_drag', '_decay')
+
+
+class TleSatellite:
+	"""
+	A satellite known by its TLE lines, standing in for its ephem object until one is needed. The engine
+	propagates it from the lines, so its ephem object is only built (and validated by ephem) when
+	something reads it through materialize.
+
+	Attributes:
+	    name (str): The title line of the TLE.
+	    line1 (str): The first line of the TLE.
+	    line2 (str): The second line of the TLE.
+	    catalog_number (int): The NORAD catalog number, as ephem.EarthSatellite names it.
+	    _epoch (float): The TLE epoch as an ephem date, as ephem.EarthSatellite names it.
+	"""
+
+	__slots__ = ('name', 'line1', 'line2', 'catalog_number', '_epoch', '_ephem')
+
+	def __init__(self, name, line1, line2):
+		self.name = name
+		self.line1 = line1
+		self.line2 = line2
+		self.catalog_number = int(line1[2:7])
+		self._epoch = tle_epoch(line1) - EPHEM_EPOCH_JD
+		self._ephem = None
+
+
+	@property
+	def ephem(self):
+		"""
+		The ephem object of the satellite, read from its TLE on first use.
+		"""
+		if self._ephem is None:
+			self._ephem = ENGINE.read_tle(self.name, self.line1, self.line2)
+		return self._ephem
+
+
+def materialize(sat):
+	"""
+	Returns the ephem object of a satellite, building it if the satellite is a TleSatellite.
+	"""
+	return sat.ephem if isinstance(sat, TleSatellite) else sat
+
+
+def satellite_key(sat):
+	"""
+	Returns the key identifying a satellite in the PropagationEngine and the PreferenceCache.
+
+	Satellites read from a TLE are keyed by their TLE lines, whether they are a TleSatellite or the ephem
+	object of one read through the engine, so both forms of a satellite share its key. Other satellites
+	(e.g. generated constellations) are keyed by their orbital elements.
+
+	Args:
+		sat (ephem.EarthSatellite or TleSatellite): The satellite object.
+
+	Returns:
+		tuple: The two TLE lines, or the EPHEM_ELEMENTS, of the satellite.
+	"""
+	if isinstance(sat, TleSatellite):
+		return sat.line1.strip(), sat.line2.strip()
+	elements = ephem_elements(sat)
+	return ENGINE.tle_lines.get(elements, elements)
+
+
+def ephem_elements(sat):
+	"""
+	Returns the EPHEM_ELEMENTS of an ephem satellite, as floats (0 for a missing catalog number).
+	"""
+	return tuple(float(getattr(sat, element) or 0) for element in EPHEM_ELEMENTS)
+
+
+def failed_satellites(states):
+	"""
+	Returns the indices of the satellites whose states (see compute_states) are NaN, as SGP4 failed to propagate them.
+	"""
+	return np.flatnonzero(~np.isfinite(states).all(axis=1))
+
+
+def satellite_name(sat, k):
+	"""
+	Returns the name of satellite k of a list for messages, its index if it has none (e.g. generated satellites).
+	"""
+	return getattr(sat, 'name', None) or "#%i" % k
+
+
+def julian_date(date_str):
+	"""
+	Converts a date string to a Julian date split in whole and fractional days, as sgp4 takes it.
+
+	Args:
+		date_str (str): The date string (in any format ephem.Date accepts).
+
+	Returns:
+		tuple: The whole and the fractional part of the Julian date.
+	"""
+	date = float(ephem.Date(date_str))
+	whole = math.floor(date)
+	return whole + EPHEM_EPOCH_JD, date - whole
+
+
+def propagator_from_ephem(sat):
+	"""
+	Builds the SGP4 propagator of a satellite that was not read from TLE lines, from its ephem elements.
+
+	Args:
+		sat (ephem.EarthSatellite): The satellite object.
+
+	Returns:
+		sgp4.api.Satrec: The propagator.
+	"""
+	propagator = Satrec()
+	propagator.sgp4init(WGS72, 'i', sat.catalog_number or 0, float(sat._epoch) + EPHEM_EPOCH_JD - SGP4_EPOCH_JD,
+			    float(sat._drag), float(sat._decay) * 2 * math.pi / MINUTES_PER_DAY ** 2, 0.0, float(sat._e),
+			    float(sat._ap), float(sat._inc), float(sat._M), float(sat._n) * 2 * math.pi / MINUTES_PER_DAY,
+			    float(sat._raan))
+	return propagator
+
+
+def propagator_elements(propagators):
+	"""
+	Collects the elements of propagators as columns.
+
+	Args:
+		propagators (List[sgp4.api.Satrec]): The propagators.
+
+	Returns:
+		numpy.ndarray: An (N, len(PROPAGATOR_ELEMENTS)) array of elements.
+	"""
+	return np.array([[getattr(propagator, element) for element in PROPAGATOR_ELEMENTS] for propagator in propagators],
+			dtype=float).reshape(len(propagators), len(PROPAGATOR_ELEMENTS))
+
+
+def greenwich_sidereal_time(jd, fr):
+	"""
+	Returns the Greenwich mean sidereal time (IAU 1982, as SGP4 uses it) in radians.
+	"""
+	centuries = ((jd - 2451545.0) + fr) / 36525.0
+	seconds = (67310.54841 + (876600.0 * 3600 + 8640184.812866) * centuries
+		   + 0.093104 * centuries ** 2 - 6.2e-6 * centuries ** 3)
+	return np.radians(seconds / 240.0) % (2 * math.pi)
+
+
+def subsatellite_points(positions, jd, fr):
+	"""
+	Converts TEME positions to sub-satellite points on the WGS84 ellipsoid.
+
+	Args:
+		positions (numpy.ndarray): An (N, 3) array of TEME positions in meters.
+		jd (float): Whole part of the Julian date of the positions.
+		fr (float): Fractional part of the Julian date of the positions.
+
+	Returns:
+		numpy.ndarray: An (N, 3) array of longitude, geodetic latitude (radians) and height (meters).
+	"""
+	gmst = greenwich_sidereal_time(jd, fr)
+	x = math.cos(gmst) * positions[:, 0] + math.sin(gmst) * positions[:, 1]
+	y = -math.sin(gmst) * positions[:, 0] + math.cos(gmst) * positions[:, 1]
+	z = positions[:, 2]
+
+	# Bowring's method, exact to millimeters at orbital altitudes
+	a = EARTH_RADIUS_M
+	b = a * (1 - EARTH_FLATTENING)
+	e2 = EARTH_FLATTENING * (2 - EARTH_FLATTENING)
+	p = np.hypot(x, y)
+	theta = np.arctan2(z * a, p * b)
+	latitude = np.arctan2(z + (a ** 2 - b ** 2) / b * np.sin(theta) ** 3, p - e2 * a * np.cos(theta) ** 3)
+	height = p / np.cos(latitude) - a / np.sqrt(1 - e2 * np.sin(latitude) ** 2)
+	return np.column_stack((np.arctan2(y, x), latitude, height))
+
+
+def compute_states(propagators, jd, fr):
+	"""
+	Propagates satellites to one time and returns their positions and sub-satellite points.
+
+	Args:
+		propagators (List[sgp4.api.Satrec]): The propagators.
+		jd (float): Whole part of the Julian date.
+		fr (float): Fractional part of the Julian date.
+
+	Returns:
+		numpy.ndarray: An (N, 6) array of TEME x, y, z (meters), sublong, sublat (radians) and elevation (meters).
+			       The states of the satellites SGP4 fails to propagate are NaN.
+	"""
+	states = np.empty((len(propagators), STATE_COLUMNS))
+	if propagators:
+		errors, positions, _ = SatrecArray(propagators).sgp4(np.array([jd]), np.array([fr]))
+		states[:, :3] = positions[:, 0] * 1000  # converts km's to m's
+		states[errors[:, 0] != 0, :3] = np.nan
+		states[:, 3:] = subsatellite_points(states[:, :3], jd, fr)
+	return states
+
+
+class PropagationEngine:
+	"""
+	The single place satellites are propagated. Reads TLEs, keeps one SGP4 propagator per satellite and
+	serves the states the solver and the visualizer use, and the sample positions of the CZML tracks.
+
+	Propagators are built from the TLE lines when the satellite is a TleSatellite or was read through
+	read_tle, and from its ephem elements otherwise (e.g. for generated constellations).
+
+	Attributes:
+	    tle_propagators (dict): The propagator of every TLE, by its lines.
+	    tle_lines (dict): The TLE lines of every satellite read through read_tle, by its ephem_elements.
+	    propagators (dict): The propagator of every other satellite, by its ephem_elements.
+	"""
+
+	def __init__(self):
+		self.tle_propagators = {}
+		self.tle_lines = {}
+		self.propagators = {}
+
+
+	def read_tle(self, name, line1, line2):
+		"""
+		Reads and validates a TLE, and keeps its propagator for the satellite.
+
+		Args:
+			name (str): The title line of the TLE.
+			line1 (str): The first line of the TLE.
+			line2 (str): The second line of the TLE.
+
+		Returns:
+			ephem.EarthSatellite: The satellite object.
+		"""
+		sat = ephem.readtle(name, line1, line2)
+		self.tle_lines[ephem_elements(sat)] = (line1.strip(), line2.strip())
+		return sat
+
+
+	def tle_propagator(self, line1, line2):
+		"""
+		Returns the propagator of a TLE, building it on first use.
+		"""
+		key = (line1.strip(), line2.strip())
+		if key not in self.tle_propagators:
+			self.tle_propagators[key] = Satrec.twoline2rv(key[0], key[1], WGS72)
+		return self.tle_propagators[key]
+
+
+	def propagator(self, sat):
+		"""
+		Returns the propagator of a satellite, building it from its ephem elements if it was not read from a TLE.
+		"""
+		key = satellite_key(sat)
+		if isinstance(key[0], str):
+			return self.tle_propagator(*key)
+		if key not in self.propagators:
+			self.propagators[key] = propagator_from_ephem(sat)
+		return self.propagators[key]
+
+
+	def states(self, sats, epoch_str, allow_failed=False):
+		"""
+		Returns the states of satellites at an epoch, see compute_states.
+
+		Args:
+			sats (List[ephem.EarthSatellite or TleSatellite]): The satellite objects.
+			epoch_str (str): The epoch time string.
+			allow_failed (bool): Return NaN states for the satellites SGP4 fails to propagate (e.g. decayed, 
+					     or too far from their TLE epoch) instead of raising a ValueError naming them.
+
+		Returns:
+			numpy.ndarray: An (N, 6) array of states.
+		"""
+		jd, fr = julian_date(epoch_str)
+		states = compute_states([self.propagator(sat) for sat in sats], jd, fr)
+		if not allow_failed:
+			failed = failed_satellites(states)
+			if len(failed):
+				raise ValueError(f"{len(failed)} satellites fail to propagate at {epoch_str}: "
+						 + ", ".join(satellite_name(sats[k], k) for k in failed.tolist()))
+		return states
+
+
+	def positions(self, propagators, jd, fr):
+		"""
+		Propagates satellites over many times in one vectorized call.
+
+		Args:
+			propagators (List[sgp4.api.Satrec]): The propagators.
+			jd (numpy.ndarray): Whole parts of the Julian dates.
+			fr (numpy.ndarray): Fractional parts of the Julian dates.
+
+		Returns:
+			numpy.ndarray: An (N, T, 3) array of TEME positions in meters, NaN where SGP4 fails.
+		"""
+		if not propagators:
+			return np.zeros((0, len(jd), 3))
+		errors, positions, _ = SatrecArray(propagators).sgp4(jd, fr)
+		positions[errors != 0] = np.nan
+		return positions * 1000  # converts km's to m's
+
+
+# The engine shared by the solver, the visualizer and the TLE readers
+ENGINE = PropagationEngine()
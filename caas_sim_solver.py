@@ -1,17 +1,25 @@
-from ortools.linear_solver import pywraplp
+import itertools
+import numpy as np
+import time
 
 try:
 	from . import caas_sim_utils
+	from . import caas_sim_backends
 except (ImportError, SystemError):
 	import caas_sim_utils
+	import caas_sim_backends
 
 RADIUS = 10000000
+# Minimum number of physical satellites each virtual satellite may be assigned to when pruning pairs by RADIUS
+FALLBACK_K = 3
+# Largest RAAN difference, in degrees, between neighbouring satellites of the same orbital plane
+PLANE_RAAN_GAP = 2.0
 
 
 
 # Solves the satellite assignment problem by assigning virtual satellites to physical satellites
 # based on a set of constraints and an optimization objective.
-def solve_sat_wrapper(data, virtual_tles, physical_tles):
+def solve_sat_wrapper(data, virtual_tles, physical_tles, prune=True, backend='scip', **options):
 	'''
 	Solves the satellite assignment problem by assigning virtual satellites to physical satellites
 	based on a set of constraints and an optimization objective.
@@ -21,22 +29,429 @@ def solve_sat_wrapper(data, virtual_tles, physical_tles):
 			     and any necessary preprocessed data (like position, constraints, etc.).
 		virtual_tles (list): Two-Line Element (TLE) data for virtual satellites, used to generate their orbits.
 		physical_tles (list): TLE data for physical satellites, used to generate their orbits.
+		prune (bool): Only consider pairs within RADIUS (plus the FALLBACK_K nearest physical satellites 
+			      of each virtual satellite) instead of every pair.
+		backend (str): Solver backend, one of caas_sim_backends.BACKENDS or "auto".
+		options: Options passed on to the solver backend.
 	
 	Returns:
 		str: A visualization string that shows the assignment results and satellite orbits in CZML format
 		     for use with Cesium.
 	'''
-	solver = pywraplp.Solver.CreateSolver("SCIP")
-	x = solve_sat_wrapper_helper(data, solver) # x[i, j] = 1 if item i is packed in bin j.
+	return "".join(solve_sat_wrapper_chunks(data, virtual_tles, physical_tles, prune, backend, **options))
+
+
+def solve_sat_wrapper_chunks(data, virtual_tles, physical_tles, prune=True, backend='scip', **options):
+	'''
+	Solves the satellite assignment problem like solve_sat_wrapper, but returns the visualization as 
+	chunks generated on demand, for caas_sim_utils.write_viz_files to write out as they come. The 
+	assignment is solved (and printed) before this returns.
+	
+	Args:
+		See solve_sat_wrapper.
+	
+	Returns:
+		Iterator[str]: The successive parts of the visualization string of solve_sat_wrapper.
+	'''
+	result = solve_assignment(data, prune, backend, **options)
+	print_solve_wrapper_res(result, data)
+	return itertools.chain(caas_sim_utils.wrapper_visualize_chunks(data, result.assignment),
+			       caas_sim_utils.orbit_czml_chunks(virtual_tles, physical_tles))
+
+
+def solve_assignment(data, prune=True, backend='scip', decompose=None, processes=None, **options):
+	'''
+	Builds the assignment model of a data model at its epoch and solves it.
 	
-	status = solver.Solve()
-	print_solve_wrapper_res(solver, status, x, data)
-	viz_string = caas_sim_utils.wrapper_visualize(data, x)
+	Args:
+		data (dict): Contains information about the virtual and physical satellites, see solve_sat_wrapper.
+		prune (bool): Only consider candidate pairs, see solve_sat_wrapper.
+		backend (str): Solver backend, one of caas_sim_backends.BACKENDS or "auto".
+		decompose (str): None to solve the model as a whole, "components" to solve the connected components 
+				 of the pair graph separately (exact), or "plane" to split it by orbital plane of the 
+				 physical satellites, giving every virtual satellite to the plane of its most preferred 
+				 candidate and dropping the pairs across planes (faster, not exact).
+		processes (int): Number of worker processes for the parts of a decomposed model, all CPUs if None.
+		options: Options passed on to the solver backend.
+	
+	Returns:
+		caas_sim_backends.SolveResult: The result of the backend. Its build time includes building the model.
+	'''
+	build_start = time.perf_counter()
+	if prune:
+		# Only the candidate pairs are evaluated, never the whole preference matrix
+		pairs = candidate_pairs(data)
+		model = AssignmentModel(data, pair_preferences(data, pairs), pairs)
+	else:
+		model = AssignmentModel(data, preference_matrix(data))
+	if decompose == 'components':
+		virtual_labels, physical_labels = caas_sim_backends.component_labels(model)
+	elif decompose == 'plane':
+		virtual_labels, physical_labels = plane_labels(data, model)
+	elif decompose is not None:
+		raise ValueError(f"Unknown decomposition {decompose}. Expected components or plane.")
+	build_time = (time.perf_counter() - build_start) * 1000
+
+	if decompose is None:
+		result = caas_sim_backends.solve(model, backend, **options)
+	else:
+		result = caas_sim_backends.solve_decomposed(model, virtual_labels, physical_labels, backend, processes,
+							    exact=decompose == 'components', **options)
+	result.build_time += build_time
+	return result
+
+
+def solve_sat_schedule(data, start_time, end_time, step, prune=True, backend='scip', **options):
+	'''
+	Solves the satellite assignment problem at every step of a time range. Each solve is warm-started
+	with the previous step's assignment as a solution hint, which consecutive epochs mostly keep.
+	
+	Args:
+		data (dict): Contains information about the virtual and physical satellites, see solve_sat_wrapper.
+		start_time (datetime): Time of the first step.
+		end_time (datetime): Time after which no more steps are solved.
+		step (timedelta): Time between two steps.
+		prune (bool): Only consider candidate pairs at each step, see solve_sat_wrapper.
+		backend (str): Solver backend, one of caas_sim_backends.BACKENDS or "auto".
+		options: Options passed on to the solver backend.
+	
+	Returns:
+		List[dict]: One entry per step with the 'epoch_str' of the step, its solver 'status', the 
+			    'assignment' as {virtual index: physical index}, and the model 'build_time' and 
+			    'solve_time' in milliseconds.
+	'''
+	schedule = []
+	assignment = {}
+	cur_time = start_time
+	while cur_time <= end_time:
+		# Cache entries are per epoch, so every step gets a cache of its own, dropped with the step
+		step_data = dict(data, epoch_str=cur_time.strftime("%Y-%m-%d %H:%M:%S"),
+				 preference_cache=caas_sim_utils.PreferenceCache())
+		result = solve_assignment(step_data, prune, backend, hint=assignment, **options)
+		assignment = result.assignment if result.found else {}
+		schedule.append({
+			'epoch_str': step_data['epoch_str'],
+			'status': result.status,
+			'assignment': assignment,
+			'build_time': result.build_time,
+			'solve_time': result.solve_time
+		})
+		cur_time += step
+	return schedule
+
+
+def print_schedule_res(schedule):
+	"""
+    Prints the results of a time-stepped schedule.
+
+    Parameters:
+    schedule: The list of steps returned by solve_sat_schedule.
+
+    Returns:
+    None
+    """
+	prev_assignment = {}
+	for step in schedule:
+		moved = sum(1 for i, j in step['assignment'].items() if prev_assignment.get(i, j) != j)
+		print(step['epoch_str'], "status:", step['status'],
+		      " assigned:", len(step['assignment']),
+		      " reassigned:", moved,
+		      " build time:", round(step['build_time']), "milliseconds",
+		      " solve time:", round(step['solve_time']), "milliseconds")
+		prev_assignment = step['assignment']
+	print("Total build time = ", round(sum(step['build_time'] for step in schedule)), " milliseconds")
+	print("Total solve time = ", round(sum(step['solve_time'] for step in schedule)), " milliseconds")
 
-	return viz_string + caas_sim_utils.orbit_czml(virtual_tles) + caas_sim_utils.orbit_czml(physical_tles)
 
+def preference_matrix(data_model):
+	"""
+	Returns the preference of every virtual satellite for every physical satellite at the data model's epoch,
+	read from (and stored in) the data model's preference cache.
+
+	Parameters:
+	    data_model (dict): The data model, see solve_sat_wrapper_helper.
+
+	Returns:
+	    numpy.ndarray: A (V, P) array where entry [i, j] is the preference of virtual i for physical j.
+	"""
+	return caas_sim_utils.preference_cache(data_model).preference_matrix(
+		data_model['virtual'].satellites, data_model['physical'].satellites, RADIUS, data_model['epoch_str'])
+
+
+def pair_preferences(data_model, pairs):
+	"""
+	Returns the preferences of some (virtual, physical) pairs at the data model's epoch, from the states 
+	in the data model's preference cache.
 
-def solve_sat_wrapper_helper(data_model, solver):
+	Parameters:
+	    data_model (dict): The data model, see solve_sat_wrapper_helper.
+	    pairs (numpy.ndarray): A (K, 2) array of (virtual index, physical index) pairs.
+
+	Returns:
+	    numpy.ndarray: The preference of every pair.
+	"""
+	return caas_sim_utils.preference_cache(data_model).pair_preferences(
+		data_model['virtual'].satellites, data_model['physical'].satellites, pairs, RADIUS, data_model['epoch_str'])
+
+
+def candidate_pairs(data_model):
+	"""
+	Returns the (virtual, physical) pairs worth a decision variable: the pairs within RADIUS, since
+	every other pair has a preference of 0, plus the FALLBACK_K nearest physical satellites of every
+	virtual satellite with fewer candidates than that.
+
+	Parameters:
+	    data_model (dict): The data model, see solve_sat_wrapper_helper.
+
+	Returns:
+	    numpy.ndarray: A (K, 2) array of (virtual index, physical index) pairs.
+	"""
+	return caas_sim_utils.preference_cache(data_model).candidate_pairs(
+		data_model['virtual'].satellites, data_model['physical'].satellites, RADIUS, data_model['epoch_str'],
+		FALLBACK_K)
+
+
+def orbital_planes(inclination, raan):
+	"""
+	Groups satellites by orbital plane: satellites with the same inclination (to the degree) whose
+	RAANs are chained by gaps of at most PLANE_RAAN_GAP degrees, wrapping around at 360, share a plane.
+
+	Parameters:
+	    inclination (numpy.ndarray): The inclination of every satellite, in radians.
+	    raan (numpy.ndarray): The right ascension of the ascending node of every satellite, in radians.
+
+	Returns:
+	    numpy.ndarray: The plane label of every satellite.
+	"""
+	inclination = np.round(np.degrees(inclination))
+	raan = np.degrees(raan) % 360
+	labels = np.zeros(len(inclination), dtype=np.int64)
+	next_label = 0
+	for inc in np.unique(inclination):
+		members = np.flatnonzero(inclination == inc)
+		members = members[np.argsort(raan[members], kind='stable')]
+		plane = np.cumsum(np.diff(raan[members], prepend=raan[members[0]]) > PLANE_RAAN_GAP)
+		# The first and last planes are the same one if they are close across 360 degrees
+		if plane[-1] > 0 and raan[members[0]] + 360 - raan[members[-1]] <= PLANE_RAAN_GAP:
+			plane[plane == plane[-1]] = 0
+		labels[members] = next_label + plane
+		next_label += plane.max() + 1
+	return labels
+
+
+def plane_labels(data_model, model):
+	"""
+	Labels the physical satellites with their orbital plane and every virtual satellite with the plane
+	of its most preferred candidate physical satellite.
+
+	Parameters:
+	    data_model (dict): The data model, see solve_sat_wrapper_helper.
+	    model (AssignmentModel): The assignment model of the data model.
+
+	Returns:
+	    tuple: The label of every virtual and of every physical satellite. Virtual satellites without 
+	           candidates get a label of their own, so their part is reported as infeasible.
+	"""
+	physical = data_model['physical']
+	physical_labels = orbital_planes(physical.element('inclo'), physical.element('nodeo'))
+	virtual_labels = physical_labels.max(initial=-1) + 1 + np.arange(model.num_virtual)
+	# Stable sort by virtual then preference, so the last column of each virtual is its most preferred
+	order = np.lexsort((model.preference, model.pair_virtual))
+	is_last = np.ones(model.num_pairs, dtype=bool)
+	is_last[:-1] = model.pair_virtual[order][1:] != model.pair_virtual[order][:-1]
+	best = order[is_last]
+	virtual_labels[model.pair_virtual[best]] = physical_labels[model.pair_physical[best]]
+	return virtual_labels, physical_labels
+
+
+class AssignmentModel:
+	"""
+	The virtual-to-physical assignment problem as coefficient arrays, independent of any solver.
+
+	Every (virtual, physical) pair that may be assigned is a column k. Rows are stored in compressed 
+	sparse row form: the columns of virtual satellite i are virtual_cols[virtual_ptr[i]:virtual_ptr[i + 1]] 
+	and the columns of physical satellite j are physical_cols[physical_ptr[j]:physical_ptr[j + 1]].
+	The demand of column k for resource field f is demand[f, pair_virtual[k]] and the capacity of 
+	physical satellite j for field f is capacity[f, j]. Pairs where the virtual satellite requires a 
+	boolean capability the physical satellite lacks are not columns at all.
+
+	The preference is given either as the (V, P) preference matrix, or, with pairs, as the preference 
+	of every pair, so pruned models never need the whole matrix.
+	"""
+
+	def __init__(self, data_model, preference, pairs=None):
+		data = data_model
+		self.num_virtual = len(data["virtual"])
+		self.num_physical = len(data["physical"])
+		if pairs is None:
+			pairs = np.argwhere(np.ones((self.num_virtual, self.num_physical), dtype=bool))
+		pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+		preference = np.asarray(preference, dtype=float)
+		if preference.ndim == 2:
+			preference = preference[pairs[:, 0], pairs[:, 1]]
+
+		self.flags, requires, provides = capability_arrays(data)
+		capable = ~np.any(requires[:, pairs[:, 0]] & ~provides[:, pairs[:, 1]], axis=0)
+		pairs = pairs[capable]
+
+		self.pair_virtual = pairs[:, 0]
+		self.pair_physical = pairs[:, 1]
+		self.preference = preference[capable]
+		self.virtual_cols, self.virtual_ptr = csr_index(self.pair_virtual, self.num_virtual)
+		self.physical_cols, self.physical_ptr = csr_index(self.pair_physical, self.num_physical)
+		self.fields, self.demand, self.capacity = capacity_arrays(data)
+
+
+	@property
+	def num_pairs(self):
+		return len(self.pair_virtual)
+
+
+	def subset(self, virtual, physical, columns=None):
+		"""
+		Returns the model restricted to some virtual and physical satellites, renumbered in increasing order.
+		Pairs with either satellite outside the subset are dropped.
+
+		Parameters:
+		    virtual (numpy.ndarray): Sorted indices of the virtual satellites to keep.
+		    physical (numpy.ndarray): Sorted indices of the physical satellites to keep.
+		    columns (numpy.ndarray): The pairs to keep, if already known to lie within the subset. 
+		                             Saves a pass over every pair of the model.
+
+		Returns:
+		    AssignmentModel: The restricted model.
+		"""
+		if columns is None:
+			keep = np.zeros(self.num_virtual, dtype=bool)
+			keep[virtual] = True
+			columns = keep[self.pair_virtual]
+			keep = np.zeros(self.num_physical, dtype=bool)
+			keep[physical] = True
+			columns = np.flatnonzero(columns & keep[self.pair_physical])
+
+		sub = AssignmentModel.__new__(AssignmentModel)
+		sub.num_virtual = len(virtual)
+		sub.num_physical = len(physical)
+		sub.flags = self.flags
+		sub.pair_virtual = np.searchsorted(virtual, self.pair_virtual[columns])
+		sub.pair_physical = np.searchsorted(physical, self.pair_physical[columns])
+		sub.preference = self.preference[columns]
+		sub.virtual_cols, sub.virtual_ptr = csr_index(sub.pair_virtual, sub.num_virtual)
+		sub.physical_cols, sub.physical_ptr = csr_index(sub.pair_physical, sub.num_physical)
+		sub.fields = self.fields
+		sub.demand = self.demand[:, virtual]
+		sub.capacity = self.capacity[:, physical]
+		return sub
+
+
+	def max_load(self, f):
+		"""
+		Returns the demand for field f on every physical satellite if all of its candidate virtual satellites were assigned to it.
+		"""
+		return np.bincount(self.pair_physical, weights=self.demand[f, self.pair_virtual],
+				   minlength=self.num_physical)
+
+
+	def build_mip(self, solver):
+		"""
+		Loads the decision variables, constraints and objective of the model into a linear solver, 
+		replacing its current model. The model is written as one MPModelProto straight from the 
+		coefficient arrays, rows a slice of the CSR index each, so the solver reads it in one call 
+		rather than one call per coefficient.
+
+		Parameters:
+		    solver: An instance of a pywraplp solver.
+
+		Returns:
+		    The dictionary of decision variables keyed by (virtual index, physical index).
+		"""
+		from ortools.linear_solver import linear_solver_pb2
+
+		proto = linear_solver_pb2.MPModelProto(maximize=True)
+		# Objective: Maximize the total preference score for the assignments.
+		for pref in self.preference.tolist():
+			proto.variable.add(lower_bound=0, upper_bound=1, is_integer=True, objective_coefficient=pref)
+
+		# Each virtual satellite must be assigned to exactly one physical satellite.
+		for i in range(self.num_virtual):
+			cols = self.virtual_cols[self.virtual_ptr[i]:self.virtual_ptr[i + 1]]
+			row = proto.constraint.add(lower_bound=1, upper_bound=1)
+			row.var_index.extend(cols.tolist())
+			row.coefficient.extend([1.0] * len(cols))
+
+		# Ensures that the demand does not exceed physical satellites capabilities. Rows that cannot
+		# bind, because all candidate virtual satellites together fit, are left out.
+		for f in range(len(self.fields)):
+			coefficients = self.demand[f, self.pair_virtual]
+			for j in np.flatnonzero(self.max_load(f) > self.capacity[f]).tolist():
+				cols = self.physical_cols[self.physical_ptr[j]:self.physical_ptr[j + 1]]
+				cols = cols[coefficients[cols] != 0]
+				row = proto.constraint.add(lower_bound=-np.inf, upper_bound=float(self.capacity[f, j]))
+				row.var_index.extend(cols.tolist())
+				row.coefficient.extend(coefficients[cols].tolist())
+
+		error = solver.LoadModelFromProto(proto)
+		if error:
+			raise ValueError(f"The solver rejected the assignment model: {error}")
+		return dict(zip(zip(self.pair_virtual.tolist(), self.pair_physical.tolist()), solver.variables()))
+
+
+def csr_index(rows, num_rows):
+	"""
+	Groups column indices by row.
+
+	Parameters:
+	    rows (numpy.ndarray): The row of every column.
+	    num_rows (int): The number of rows.
+
+	Returns:
+	    tuple: The columns ordered by row, and the (num_rows + 1) offsets of each row in that order.
+	"""
+	cols = np.argsort(rows, kind='stable')
+	ptr = np.zeros(num_rows + 1, dtype=np.int64)
+	ptr[1:] = np.cumsum(np.bincount(rows, minlength=num_rows))
+	return cols, ptr
+
+
+def capability_arrays(data_model):
+	"""
+	Collects the boolean capabilities required by the virtual satellites and provided by the physical satellites.
+	A virtual satellite can only be assigned to a physical satellite that provides every capability it requires.
+
+	Parameters:
+	    data_model (dict): The data model, see solve_sat_wrapper_helper.
+
+	Returns:
+	    tuple: The list of B field names, the (B, V) array of required and the (B, P) array of provided capabilities.
+	"""
+	flags = list(caas_sim_utils.CAPABILITY_FLAGS)
+	requires = np.array([data_model["virtual"].columns[field].astype(bool) for field in flags],
+			    dtype=bool).reshape(len(flags), len(data_model["virtual"]))
+	provides = np.array([data_model["physical"].columns[field] for field in flags],
+			    dtype=bool).reshape(len(flags), len(data_model["physical"]))
+	return flags, requires, provides
+
+
+def capacity_arrays(data_model):
+	"""
+	Collects the numerical (non-boolean) fields of the physical satellites with their capacities, and the 
+	matching demands of the virtual satellites.
+
+	Parameters:
+	    data_model (dict): The data model, see solve_sat_wrapper_helper.
+
+	Returns:
+	    tuple: The list of F field names, the (F, V) demand array and the (F, P) capacity array.
+	"""
+	fields = list(caas_sim_utils.CAPACITY_FIELDS)
+	demand = np.array([data_model["virtual"].columns[field] for field in fields],
+			  dtype=float).reshape(len(fields), len(data_model["virtual"]))
+	capacity = np.array([data_model["physical"].columns[field] for field in fields],
+			    dtype=float).reshape(len(fields), len(data_model["physical"]))
+	return fields, demand, capacity
+
+
+def solve_sat_wrapper_helper(data_model, solver, preference=None, pairs=None):
 	"""
 	Helper function to solve the satellite assignment problem using Google OR-Tools.
 
@@ -44,99 +459,86 @@ def solve_sat_wrapper_helper(data_model, solver):
 	    data_model (dict): A dictionary containing the necessary data for the model, including:
 	                       - 'virtual_list': List of virtual satellites.
 	                       - 'physical_list': List of physical satellites.
-	                       - 'virtual': Details of virtual satellites demand.
-	                       - 'physical': Details of physical satellites capabilities.
+	                       - 'virtual': caas_sim_utils.Constellation of the virtual satellites demand.
+	                       - 'physical': caas_sim_utils.Constellation of the physical satellites capabilities.
 	                       - 'epoch_str': Time epoch for the satellite positions.
 	    solver: An instance of a solver from OR-Tools used for optimization.
+	    preference (numpy.ndarray): Preference matrix, read from the data model's preference cache if None.
+	    pairs (numpy.ndarray): (virtual index, physical index) pairs to create decision variables for, 
+	                           every pair if None.
 
 	    Returns:
 	    The dictionary of decision variables containing assignment results and optimization status. 
 	"""
-	data = data_model
-	x = {}
-	for i in data["virtual_list"]:
-		for j in data["physical_list"]:
-			x[(i, j)] = solver.IntVar(0, 1, "x_%i_%i" % (i, j))
-
-	# Constraints
-	# Each virtual satellite must be assigned to exactly one physical satellite.
-	for i in data["virtual_list"]:
-		solver.Add(sum(x[i, j] for j in data["physical_list"]) == 1)
-
-	# Ensures that the demand does not exceed physical satellites capabilities.
-	for i in data["physical_list"]:
-		physical_obj = data["physical"][i]['sat_obj']
-		physical_vars = vars(physical_obj)
-		
-		for field in physical_vars: 
-			# Loop over every var to make sure demand is under physical constraint
-			field_value = getattr(physical_obj, field)
-			if isinstance(field_value, bool):
-				# If the field is a boolean, enforce constraints based on its value.
-				for j in data["virtual_list"]:
-					solver.Add
-					(
-						(getattr(data["virtual"][j]['sat_obj'], field) == field_value)
-						or (field_value and not getattr(data["virtual"][j]['sat_obj'], field))
-					)
-
-			if isinstance(field_value, int) or isinstance(field_value, float):
-				# For numerical fields, ensure that the total assigned demand does not exceed capacity.
-				solver.Add
-				(
-					sum(x[j, i] * getattr(data["virtual"][j]['sat_obj'], field)
-						for j in data["virtual_list"]) <= field_value
-				)
-
-	# Objective: Maximize the total preference score for the assignments.
-	solver.Maximize(
-		solver.Sum(
-			x[i, j] *
-			caas_sim_utils.eval_preference(data['virtual'][i]['sat_obj'].ephem_sat,
-						   data['physical'][j]['sat_obj'].ephem_sat, RADIUS, data['epoch_str'])
-			for i in data['virtual_list'] for j in data['physical_list']))
-	return x
-
-
-def print_solve_wrapper_res(solver, status, assignment, data_model):
+	if preference is None:
+		preference = preference_matrix(data_model)
+	return AssignmentModel(data_model, preference, pairs).build_mip(solver)
+
+
+def print_solve_wrapper_res(result, data_model, preference=None):
 	"""
     Prints the results of the satellite assignment optimization.
 
     Parameters:
-    solver: The solver instance used for optimization.
-    status: The status of the solver after optimization.
-    assignment: The dictionary of decision variables containing assignment results.
+    result: The caas_sim_backends.SolveResult of the optimization.
     data_model: The data model used in the solver, providing details about the satellites.
+    preference: Preference matrix. If None, only the preferences of the assigned pairs are evaluated, 
+                from the data model's preference cache.
 
     Returns:
     None
     """
-	x = assignment
 	data = data_model
-	print("Solution found:", status == pywraplp.Solver.OPTIMAL)
+	if preference is None:
+		assigned = np.array(sorted(result.assignment.items()), dtype=np.int64).reshape(-1, 2)
+		preference = dict(zip(map(tuple, assigned.tolist()), pair_preferences(data, assigned).tolist()))
+	else:
+		preference = {(i, j): preference[i, j] for i, j in result.assignment.items()}
+	print("Solution found:", result.found, "(" + result.status + ", " + result.backend + ")")
+
+	if result.found:
+		virt_per_phys = {}
+		for i in data["virtual_list"]:
+			if i in result.assignment:
+				virt_per_phys.setdefault(result.assignment[i], []).append(i)
 
-	if status == pywraplp.Solver.OPTIMAL:
 		num_bins = 0
 		pref_sum = 0
 		for j in data["physical_list"]:
-			virt_sats = []
-			for i in data["virtual_list"]:
-				if x[i, j].solution_value() > 0:
-					virt_sats.append(i)
-					pref_sum += caas_sim_utils.eval_preference(
-						data['virtual'][i]['sat_obj'].ephem_sat,
-						data['physical'][j]['sat_obj'].ephem_sat, RADIUS, data['epoch_str']
-					)
-					# bin_weight += data["virtual"][i]
+			virt_sats = virt_per_phys.get(j, [])
+			for i in virt_sats:
+				pref_sum += preference[i, j]
 			if virt_sats:
 				num_bins += 1
 				print("Phy number", j)
 				print("  Virt packed:", virt_sats)
-				# print("  Total weight:", bin_weight)
 				print()
 		print()
 		print("Number of phys used:", num_bins)
 		print("Preference sum achieved:", pref_sum)
-		print("Time = ", solver.WallTime(), " milliseconds")
+		if result.bound is not None:
+			print("Best bound:", result.bound, "(gap " + format(result.gap, ".4%") + ")")
+		if result.incumbents:
+			print("Incumbents found:", len(result.incumbents))
+		print("Time = ", round(result.build_time + result.solve_time), " milliseconds")
+		print("Model build time = ", round(result.build_time), " milliseconds")
+		print("Solve time = ", round(result.solve_time), " milliseconds")
+		print("Preference cache:", caas_sim_utils.preference_cache(data))
 	else:
-		print("The problem does not have an optimal solution.")
+		print("The problem does not have a solution.")
+
+
+def print_incumbent(result):
+	"""
+    Prints an improving assignment as soon as a backend finds it, for use as the on_incumbent option.
+
+    Parameters:
+    result: The FEASIBLE caas_sim_backends.SolveResult of the incumbent.
+
+    Returns:
+    None
+    """
+	message = "Incumbent after " + str(round(result.solve_time)) + " milliseconds: preference sum " + str(round(result.objective, 4))
+	if result.bound is not None:
+		message += ", bound " + str(round(result.bound, 4))
+	print(message)
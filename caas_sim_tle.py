@@ -0,0 +1,313 @@
+import glob
+import hashlib
+import os
+
+import numpy as np
+from sgp4.api import jday
+
+# Parsed TLE files are cached next to them, in this directory
+TLE_CACHE_DIR = '.tle_cache'
+# Bumped whenever the records change, so caches written by older code are not loaded
+TLE_CACHE_VERSION = 2
+
+TLE_NAME_WIDTH = 24
+TLE_LINE_WIDTH = 69
+
+# Number of satellites per chunk of stream_tle_file
+TLE_CHUNK_SIZE = 4096
+# Orbits closer than this in both inclination and RAAN (degrees) are taken as the same plane by PlaneIndex
+PLANE_TOLERANCE = 1.0
+
+# Block size for hashing TLE files without reading them at once
+HASH_BLOCK_SIZE = 1 << 20
+
+# Elements parsed from the TLE lines: catalog number, epoch (Julian date), angles (degrees), eccentricity,
+# mean motion (revolutions per day) and drag term
+TLE_FIELDS = (('catalog', 'i4'), ('epoch', 'f8'), ('inclination', 'f8'), ('raan', 'f8'), ('eccentricity', 'f8'),
+	      ('argp', 'f8'), ('mean_anomaly', 'f8'), ('mean_motion', 'f8'), ('bstar', 'f8'))
+
+
+def tle_dtype(name_width=TLE_NAME_WIDTH, line_width=TLE_LINE_WIDTH):
+	"""
+	Returns the record type of a parsed TLE: its three lines as bytes, followed by TLE_FIELDS.
+	"""
+	return np.dtype([('name', 'S%d' % name_width), ('line1', 'S%d' % line_width), ('line2', 'S%d' % line_width)]
+			+ list(TLE_FIELDS))
+
+
+def tle_exponent(field):
+	"""
+	Parses a TLE field in assumed decimal point notation, e.g. ' 12345-3' for 0.12345e-3.
+	"""
+	field = field.strip()
+	if not field:
+		return 0.0
+	sign = -1.0 if field[0] == '-' else 1.0
+	field = field.lstrip('+-')
+	return sign * float('0.' + field[:-2].strip()) * 10 ** int(field[-2:])
+
+
+def tle_epoch(line1):
+	"""
+	Returns the epoch of a TLE as a Julian date.
+	"""
+	year = int(line1[18:20])
+	year += 1900 if year >= 57 else 2000
+	return sum(jday(year, 1, 1, 0, 0, 0)) + float(line1[20:32]) - 1
+
+
+def tle_checksums(lines):
+	"""
+	Returns the checksums of TLE lines: the sum of their digits, minus signs counting as 1, modulo 10.
+
+	Args:
+		lines (numpy.ndarray): An (N, width) array of the characters of the lines, as bytes.
+
+	Returns:
+		numpy.ndarray: The checksum of every line.
+	"""
+	digits = (lines[:, :68] >= ord('0')) & (lines[:, :68] <= ord('9'))
+	values = np.where(digits, lines[:, :68] - ord('0'), 0) + (lines[:, :68] == ord('-'))
+	return values.sum(axis=1) % 10
+
+
+def validate_tle_records(records, source='<tle>'):
+	"""
+	Checks the structure of parsed TLEs: line numbers, lengths, matching catalog numbers and checksums.
+
+	Raises:
+		ValueError: On the first malformed TLE.
+	"""
+	line_arrays = []
+	for number, field in ((1, 'line1'), (2, 'line2')):
+		width = records.dtype[field].itemsize
+		lines = np.frombuffer(records[field].tobytes(), dtype=np.uint8).reshape(len(records), width)
+		malformed = (lines[:, 0] != ord(str(number))) | (lines[:, 1] != ord(' ')) | (lines[:, 68] < ord('0')) \
+			    | (lines[:, 68] > ord('9'))
+		malformed |= tle_checksums(lines) != lines[:, 68] - ord('0')
+		if malformed.any():
+			k = int(np.argmax(malformed))
+			raise ValueError('%s: malformed TLE line %d for %s: %r' % (source, number, records['name'][k].decode(),
+										     records[field][k].decode()))
+		line_arrays.append(lines)
+	mismatched = (line_arrays[0][:, 2:7] != line_arrays[1][:, 2:7]).any(axis=1)
+	if mismatched.any():
+		raise ValueError('%s: TLE lines of %s have different catalog numbers'
+				 % (source, records['name'][int(np.argmax(mismatched))].decode()))
+
+
+def parse_tle_lines(lines, source='<tle>'):
+	"""
+	Validates and parses TLE lines into records of tle_dtype.
+
+	Args:
+		lines (List[str]): The lines, three per satellite (title line and the two element lines), without blank lines.
+		source (str): Where the lines come from, for the error messages.
+
+	Returns:
+		numpy.ndarray: The records, one per satellite.
+	"""
+	if len(lines) % 3:
+		raise ValueError('%s: %d lines is not a whole number of TLEs' % (source, len(lines)))
+
+	names = [line.strip() for line in lines[0::3]]
+	lines1 = [line.strip() for line in lines[1::3]]
+	lines2 = [line.strip() for line in lines[2::3]]
+	encoded = {'name': [name.encode() for name in names], 'line1': [line.encode() for line in lines1],
+		   'line2': [line.encode() for line in lines2]}
+	records = np.zeros(len(names), dtype=tle_dtype(
+		max([TLE_NAME_WIDTH] + [len(name) for name in encoded['name']]),
+		max([TLE_LINE_WIDTH] + [len(line) for line in encoded['line1'] + encoded['line2']])))
+	for field, values in encoded.items():
+		records[field] = values
+	validate_tle_records(records, source)
+
+	elements = []
+	for name, line1, line2 in zip(names, lines1, lines2):
+		try:
+			elements.append((int(line2[2:7]), tle_epoch(line1), float(line2[8:16]), float(line2[17:25]),
+					 float('0.' + line2[26:33].strip()), float(line2[34:42]), float(line2[43:51]),
+					 float(line2[52:63]), tle_exponent(line1[53:61])))
+		except ValueError as error:
+			raise ValueError('%s: malformed TLE for %s: %s' % (source, name, error))
+	elements = np.array(elements, dtype=list(TLE_FIELDS)).reshape(len(names))
+	for field, _ in TLE_FIELDS:
+		records[field] = elements[field]
+	return records
+
+
+def file_digest(path):
+	"""
+	Returns the SHA-1 hash of a file, read block by block.
+	"""
+	digest = hashlib.sha1()
+	with open(path, 'rb') as f:
+		for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+			digest.update(block)
+	return digest.hexdigest()
+
+
+def tle_cache_path(tle_file, digest):
+	"""
+	Returns where the parsed form of a TLE file is cached, keyed by the hash and the modification time of the file.
+	"""
+	directory, base = os.path.split(os.path.abspath(tle_file))
+	return os.path.join(directory, TLE_CACHE_DIR, '%s.v%d.%s.%d.npy' % (base, TLE_CACHE_VERSION, digest[:16],
+									  os.stat(tle_file).st_mtime_ns))
+
+
+def read_tle_cache(cache_path):
+	"""
+	Memory-maps the cached records of a TLE file, or returns None if there are none.
+	"""
+	if os.path.exists(cache_path):
+		try:
+			return np.load(cache_path, mmap_mode='r')
+		except (OSError, ValueError):
+			pass  # a truncated or foreign cache file, parsed again by the caller
+	return None
+
+
+def write_tle_cache(tle_file, cache_path, records):
+	"""
+	Caches the records of a TLE file, replacing the caches of its former versions. Does nothing if the cache
+	directory cannot be written.
+	"""
+	try:
+		os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+		base = os.path.basename(tle_file)
+		for stale in glob.glob(os.path.join(glob.escape(os.path.dirname(cache_path)), glob.escape(base) + '.*.npy')):
+			os.remove(stale)
+		# written under a temporary name and renamed, so concurrent runs never see a partial file
+		partial_path = '%s.%d.partial' % (cache_path, os.getpid())
+		with open(partial_path, 'wb') as f:
+			np.save(f, records)
+		os.replace(partial_path, cache_path)
+	except OSError:
+		pass
+
+
+def read_tle_lines(tle_file):
+	"""
+	Reads the TLEs of a file one at a time, skipping blank lines.
+
+	Yields:
+		tuple: The title line, the first and the second element line of each satellite.
+	"""
+	with open(tle_file, 'r') as f:
+		lines = (line.rstrip('\r\n') for line in f if line.strip())
+		for name in lines:
+			line1, line2 = next(lines, None), next(lines, None)
+			if line2 is None:
+				raise ValueError('%s: truncated TLE for %s' % (tle_file, name.strip()))
+			yield name, line1, line2
+
+
+def stream_tle_file(tle_file, chunk_size=TLE_CHUNK_SIZE, cache=True):
+	"""
+	Streams a TLE file as chunks of validated records of tle_dtype, for files too large to hold at once.
+
+	The parsed records are cached in TLE_CACHE_DIR next to the file, and memory-mapped from there as long as
+	the file is unchanged, so repeated runs skip the parsing; the chunks are then slices of the cache.
+	Uncached files are read and parsed lazily, so only one chunk of text is in memory at a time. Their
+	records are kept to write the cache once the whole file was read (skipped if the directory cannot be
+	written); pass cache=False to keep nothing.
+
+	Args:
+		tle_file (str): Path to the TLE file.
+		chunk_size (int): Maximum number of satellites per chunk.
+		cache (bool): Whether to read and write the cache.
+
+	Yields:
+		numpy.ndarray: The records of up to chunk_size satellites, in file order.
+	"""
+	cache_path = tle_cache_path(tle_file, file_digest(tle_file)) if cache else None
+	records = read_tle_cache(cache_path) if cache else None
+	if records is not None:
+		for start in range(0, len(records), chunk_size):
+			yield records[start:start + chunk_size]
+		return
+
+	chunks, lines = [], []
+	for tle in read_tle_lines(tle_file):
+		lines.extend(tle)
+		if len(lines) == 3 * chunk_size:
+			chunks.append(parse_tle_lines(lines, tle_file))
+			lines = []
+			yield chunks[-1]
+			if not cache:
+				chunks = []
+	if lines:
+		chunks.append(parse_tle_lines(lines, tle_file))
+		yield chunks[-1]
+	if cache:
+		# chunks are as wide as their widest line, the cache as wide as the widest chunk
+		dtype = tle_dtype(max([TLE_NAME_WIDTH] + [chunk.dtype['name'].itemsize for chunk in chunks]),
+				  max([TLE_LINE_WIDTH] + [chunk.dtype['line1'].itemsize for chunk in chunks]))
+		write_tle_cache(tle_file, cache_path, np.concatenate([chunk.astype(dtype) for chunk in chunks]
+								     or [np.zeros(0, dtype=dtype)]))
+
+
+def tle_records(tle_files, chunk_size=TLE_CHUNK_SIZE):
+	"""
+	Yields the title and the two element lines of every satellite in TLE files, streamed through stream_tle_file.
+
+	Args:
+		tle_files (List[str]): Paths to the TLE files.
+		chunk_size (int): Number of satellites decoded at a time.
+
+	Yields:
+		tuple: The index of the file, the title line, the first and the second element line.
+	"""
+	for index, tle_file in enumerate(tle_files):
+		for chunk in stream_tle_file(tle_file, chunk_size):
+			for name, line1, line2 in zip(chunk['name'].tolist(), chunk['line1'].tolist(),
+						      chunk['line2'].tolist()):
+				yield index, name.decode(), line1.decode(), line2.decode()
+
+
+class PlaneIndex:
+	"""
+	The set of distinct orbital planes seen so far, indexed by a grid of (inclination, RAAN) cells as wide as
+	the tolerance, so a plane is only compared to the planes of its 9 neighbouring cells. RAAN wraps around,
+	so 359.5 and 0.2 degrees are 0.7 degrees apart.
+	"""
+
+	def __init__(self, tolerance=PLANE_TOLERANCE):
+		self.tolerance = tolerance
+		# the last RAAN cell takes the remainder of 360 degrees, so no cell is narrower than the tolerance
+		self.raan_cells = max(1, int(360 // tolerance))
+		self.cells = {}
+
+
+	def cell(self, inclination, raan):
+		return int(inclination // self.tolerance), min(int(raan // self.tolerance), self.raan_cells - 1)
+
+
+	def add(self, inclination, raan):
+		"""
+		Adds a plane unless it is within the tolerance of a plane already added, in both inclination and RAAN.
+
+		Args:
+			inclination (float): The inclination of the plane in degrees.
+			raan (float): The right ascension of the ascending node of the plane in degrees.
+
+		Returns:
+			bool: Whether the plane was added.
+		"""
+		raan %= 360
+		inclination_cell, raan_cell = self.cell(inclination, raan)
+		neighbours = {(inclination_cell + di, (raan_cell + dr) % self.raan_cells)
+			      for di in (-1, 0, 1) for dr in (-1, 0, 1)}
+		for neighbour in neighbours:
+			for other_inclination, other_raan in self.cells.get(neighbour, ()):
+				raan_distance = abs(raan - other_raan)
+				if (abs(inclination - other_inclination) < self.tolerance
+						and min(raan_distance, 360 - raan_distance) < self.tolerance):
+					return False
+		self.cells.setdefault((inclination_cell, raan_cell), []).append((inclination, raan))
+		return True
+
+
+	def __len__(self):
+		return sum(len(planes) for planes in self.cells.values())
@@ -1,20 +1,23 @@
+import base64
 import ephem
 import math
-from datetime import datetime, timedelta
-import pytz
-import json
-from geopy.distance import great_circle
-from astropy.time import Time
-from astropy import units as u
-from ortools.linear_solver import pywraplp
+import os
+import numpy as np
+from datetime import datetime, timedelta, timezone
 import random
 import json
+import shutil
+import zlib
 try:
 	# from . import caas_sim_solver
-	from . import satellite_czml
+	from .caas_sim_propagation import (ENGINE, TleSatellite, materialize, satellite_key, satellite_name,
+					   failed_satellites, propagator_elements, PROPAGATOR_ELEMENTS)
+	from .caas_sim_tle import PlaneIndex, stream_tle_file, tle_records
 except (ImportError, SystemError):
 	# import caas_sim_solver
-	from satellite_czml import satellite_czml
+	from caas_sim_propagation import (ENGINE, TleSatellite, materialize, satellite_key, satellite_name,
+					  failed_satellites, propagator_elements, PROPAGATOR_ELEMENTS)
+	from caas_sim_tle import PlaneIndex, stream_tle_file, tle_records
 
 
 def load_config(file_path):
@@ -22,12 +25,31 @@ def load_config(file_path):
         config = json.load(config_file)
     return config
 
-config = load_config("json/sim_config.json")
+# Read relative to this file, so runs from any directory find it
+SIM_CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "json", "sim_config.json")
+
+config = load_config(SIM_CONFIG_FILE)
 
 SATELLITE_RADIUS = config["SATELLITE_RADIUS"]
 MARKER_RADIUS = config["MARKER_RADIUS"]
 MARKER_ELEVATION = config["MARKER_ELEVATION"]
 COLOR_LIST = config["COLOR_LIST"]
+# Compact CZML output of the orbits, see orbit_czml: decimals of the positions (full precision if null),
+# minified JSON, and a gzip compressed, base64 encoded payload decompressed by the HTML page
+CZML_PRECISION = config.get("CZML_PRECISION")
+CZML_MINIFY = config.get("CZML_MINIFY", False)
+CZML_COMPRESS = config.get("CZML_COMPRESS", False)
+
+# Size of the write buffer of the visualization HTML file, in bytes
+VIZ_WRITE_BUFFER = 1 << 20
+
+# Capability schema of a satellite. Boolean capability flags (False when not configured): a virtual
+# satellite can only be assigned to a physical satellite that has every flag it requires
+CAPABILITY_FLAGS = ('rgb', 'hyperspectral', 'radar', 'GPU', 'FPGA')
+# Numerical capacity fields (0 when not configured): the virtual satellites assigned to a physical
+# satellite cannot demand more than its capacity in total
+CAPACITY_FIELDS = ('CPU', 'memory', 'storage', 'ISL_capcity', 'GSL_capacity', 'range')
+SATELLITE_FIELDS = CAPABILITY_FLAGS + CAPACITY_FIELDS
 
 
 class Satellite:
@@ -36,12 +58,14 @@ class Satellite:
 
 	This class serves as a wrapper around the ephem.EarthSatellite object, and 
 	provides attributes to store satellite-specific information and methods to read 
-	TLE data and compute orbital positions.
+	TLE data and compute orbital positions. Its attributes are fixed by the capability 
+	schema (CAPABILITY_FLAGS and CAPACITY_FIELDS) and stored in slots.
 	"""
 
-	def __init__(self, ephem_satellite: ephem.EarthSatellite): 
-		if ephem_satellite:
-			self.ephem_sat = ephem_satellite
+	__slots__ = ('ephem_sat', 'name') + SATELLITE_FIELDS
+
+	def __init__(self, ephem_satellite: ephem.EarthSatellite = None): 
+		self.ephem_sat = ephem_satellite
 		self.name = ""
 		self.rgb = False
 		self.hyperspectral = False
@@ -57,7 +81,7 @@ class Satellite:
 
 
 	def readtle(self, tle_title, tle_1, tle_2):
-		self.__init__(ephem.readtle(tle_title, tle_1, tle_2))
+		self.__init__(ENGINE.read_tle(tle_title, tle_1, tle_2))
 		return self.ephem_sat
 
 
@@ -77,6 +101,103 @@ class Satellite:
 		return self.ephem_sat.elevation
 
 
+class Constellation:
+	"""
+	A columnar store of satellites: one entry per satellite in each array instead of one object per satellite.
+
+	Attributes:
+	    satellites (List[ephem.EarthSatellite or TleSatellite]): The satellites, used to propagate them. 
+	                    Satellites loaded lazily are TleSatellites, whose ephem objects are built on first use.
+	    names (List[str]): The names of the satellites.
+	    name_index (dict): The index of every satellite name.
+	    cid (numpy.ndarray): The constellation id of every satellite.
+	    columns (dict): One array per field of SATELLITE_FIELDS, boolean for the CAPABILITY_FLAGS and 
+	                    numerical for the CAPACITY_FIELDS.
+	"""
+
+	def __init__(self, satellites, names, cids, configs=None):
+		self.satellites = list(satellites)
+		self.names = list(names)
+		self.name_index = {name: k for k, name in enumerate(self.names)}
+		self.cid = np.asarray(cids, dtype=np.int64).reshape(len(self.satellites))
+		self._elements = None
+		if configs is None:
+			configs = [{}] * len(self.satellites)
+		self.columns = {}
+		for field in CAPABILITY_FLAGS:
+			self.columns[field] = np.array([sat_config.get(field, False) for sat_config in configs],
+						       dtype=bool).reshape(len(configs))
+		for field in CAPACITY_FIELDS:
+			self.columns[field] = np.array([sat_config.get(field, 0) for sat_config in configs]).reshape(len(configs))
+			if not np.issubdtype(self.columns[field].dtype, np.number) or self.columns[field].dtype == bool:
+				raise ValueError(f"Capacity field {field} must be numerical, got {self.columns[field].dtype}.")
+
+
+	@property
+	def ephem_sats(self):
+		"""
+		The ephem objects of all the satellites, building the ones not built yet.
+		"""
+		return [materialize(sat) for sat in self.satellites]
+
+
+	@property
+	def elements(self):
+		"""
+		The (N, len(PROPAGATOR_ELEMENTS)) SGP4 elements of the satellites, angles in radians, computed on first use.
+		"""
+		if self._elements is None:
+			self._elements = propagator_elements([ENGINE.propagator(sat) for sat in self.satellites])
+		return self._elements
+
+
+	def __len__(self):
+		return len(self.satellites)
+
+
+	def __getitem__(self, k):
+		"""
+		Returns satellite k in the former {'sat_obj', 'name', 'cid'} form, built on demand.
+		"""
+		return {'sat_obj': self.satellite(k), 'name': self.names[k], 'cid': self.cid[k].item()}
+
+
+	def __iter__(self):
+		return (self[k] for k in range(len(self)))
+
+
+	def satellite(self, k):
+		"""
+		Returns a Satellite object holding the fields of satellite k.
+		"""
+		sat = Satellite(materialize(self.satellites[k]))
+		for field, column in self.columns.items():
+			setattr(sat, field, column[k].item())
+		return sat
+
+
+	def element(self, name):
+		"""
+		Returns the column of one of the PROPAGATOR_ELEMENTS.
+		"""
+		return self.elements[:, PROPAGATOR_ELEMENTS.index(name)]
+
+
+	def subset(self, indices):
+		"""
+		Returns the constellation of the satellites at indices, in that order.
+		"""
+		indices = np.asarray(indices, dtype=np.int64)
+		sub = Constellation.__new__(Constellation)
+		sub.satellites = [self.satellites[k] for k in indices.tolist()]
+		sub.names = [self.names[k] for k in indices.tolist()]
+		sub.name_index = {name: k for k, name in enumerate(sub.names)}
+		sub.cid = self.cid[indices]
+		sub._elements = None if self._elements is None else self._elements[indices]
+		sub.columns = {field: column[indices] for field, column in self.columns.items()}
+		return sub
+
+
 def generate_sat_obj_list(
 		num_orbit,
 		num_sats_per_orbit,
@@ -172,8 +293,11 @@ def write_viz_files(viz_string, top_file, bottom_file, out_file):
 	"""
 	Writes a visualization HTML string to a HTML file by combining content from the top, bottom, and a generated visualization string.
 	
+	The visualization can be given as chunks, e.g. from caas_sim_solver.solve_sat_wrapper_chunks, which are 
+	written as they are generated, through a VIZ_WRITE_BUFFER bytes buffer, so the scene is never held whole.
+	
 	Args:
-		viz_string (str): The string containing the visualization content.
+		viz_string (str or Iterable[str]): The string containing the visualization content, or its chunks.
 		top_file (str): Filepath to the top part of the HTML template.
 		bottom_file (str): Filepath to the bottom part of the HTML template.
 		out_file (str): Output file to write the final combined content.
@@ -181,13 +305,15 @@ def write_viz_files(viz_string, top_file, bottom_file, out_file):
 	Returns:
 		None
 	"""
-	writer_html = open(out_file, 'w')
-	with open(top_file, 'r') as fi:
-		writer_html.write(fi.read())
-	writer_html.write(viz_string)
-	with open(bottom_file, 'r') as fb:
-		writer_html.write(fb.read())
-	writer_html.close()
+	if isinstance(viz_string, str):
+		viz_string = [viz_string]
+	with open(out_file, 'w', buffering=VIZ_WRITE_BUFFER) as writer_html:
+		with open(top_file, 'r') as fi:
+			shutil.copyfileobj(fi, writer_html)
+		for chunk in viz_string:
+			writer_html.write(chunk)
+		with open(bottom_file, 'r') as fb:
+			shutil.copyfileobj(fb, writer_html)
 
 
 def distance_m_between_satellites(sat1, sat2, epoch_str, date_str):
@@ -203,22 +329,317 @@ def distance_m_between_satellites(sat1, sat2, epoch_str, date_str):
 	Returns:
 		float: The distance between the two satellites.
 	"""
-	# Create an observer on the planet
-	observer = ephem.Observer()
-	observer.epoch = epoch_str
-	observer.date = date_str
-	observer.lat = 0
-	observer.lon = 0
-	observer.elevation = 0
+	positions = ENGINE.states([sat1, sat2], date_str)[:, :3]
+	return float(np.linalg.norm(positions[0] - positions[1]))
 
-	# Calculate the relative location of the satellites to this observer
-	sat1.compute(observer)
-	sat2.compute(observer)
 
-	# Calculate the angle observed by the observer to the satellites (this is done because the .compute() calls earlier)
-	angle_radians = float(repr(ephem.separation(sat1, sat2)))
+def satellite_states(sats, epoch_str, allow_failed=False):
+	"""
+	Propagates every satellite once to an epoch and returns its position and sub-satellite point.
+	
+	The first three columns are the Cartesian (TEME) position, so distances between rows match 
+	distance_m_between_satellites for the same epoch.
+	
+	Args:
+		sats (List[ephem.EarthSatellite]): The satellite objects.
+		epoch_str (str): The epoch time string.
+		allow_failed (bool): Return NaN states for the satellites that fail to propagate instead of 
+				     raising a ValueError naming them.
+	
+	Returns:
+		numpy.ndarray: An (N, 6) array of x, y, z (meters), sublong, sublat (radians) and elevation (meters).
+	"""
+	return ENGINE.states(sats, epoch_str, allow_failed)
 
-	return math.sqrt(sat1.range ** 2 + sat2.range ** 2 - (2 * sat1.range * sat2.range * math.cos(angle_radians)))
+
+def satellite_positions(sats, epoch_str):
+	"""
+	Propagates every satellite once to an epoch and returns its Cartesian (TEME) position.
+	
+	Distances between rows of the result match distance_m_between_satellites for the same epoch.
+	
+	Args:
+		sats (List[ephem.EarthSatellite]): The satellite objects.
+		epoch_str (str): The epoch time string.
+	
+	Returns:
+		numpy.ndarray: An (N, 3) array of positions in meters.
+	"""
+	return satellite_states(sats, epoch_str)[:, :3]
+
+
+def distance_matrix(positions_a, positions_b):
+	"""
+	Calculates the pairwise distances between two sets of positions.
+	
+	Args:
+		positions_a (numpy.ndarray): An (N, 3) array of positions in meters.
+		positions_b (numpy.ndarray): An (M, 3) array of positions in meters.
+	
+	Returns:
+		numpy.ndarray: An (N, M) array of distances in meters.
+	"""
+	# |a - b|^2 = |a|^2 + |b|^2 - 2 a.b, avoids materializing an (N, M, 3) difference array
+	squared = (np.einsum('ij,ij->i', positions_a, positions_a)[:, None]
+		+ np.einsum('ij,ij->i', positions_b, positions_b)[None, :]
+		- 2 * positions_a @ positions_b.T)
+	return np.sqrt(np.maximum(squared, 0))
+
+
+def preference_matrix(virtual_sats, phys_sats, radius, epoch):
+	"""
+	Evaluates eval_preference for every (virtual, physical) pair in one vectorized pass.
+	
+	Args:
+		virtual_sats (List[ephem.EarthSatellite]): The virtual satellite objects.
+		phys_sats (List[ephem.EarthSatellite]): The physical satellite objects.
+		radius (float): Distance in meters beyond which the preference is 0.
+		epoch (str): The epoch time string.
+	
+	Returns:
+		numpy.ndarray: A (V, P) array where entry [i, j] is the preference of virtual i for physical j.
+	"""
+	distance = distance_matrix(satellite_positions(virtual_sats, epoch), satellite_positions(phys_sats, epoch))
+	return distance_to_preference(distance, radius)
+
+
+def distance_to_preference(distance, radius):
+	"""
+	Converts distances to preferences the same way eval_preference does.
+	
+	Args:
+		distance (numpy.ndarray): Distances in meters.
+		radius (float): Distance in meters beyond which the preference is 0.
+	
+	Returns:
+		numpy.ndarray: Preferences with the same shape as distance.
+	"""
+	return np.where(distance < radius, 1 - distance / radius, 0.0)
+
+
+def pair_preferences(virtual_positions, phys_positions, pairs, radius):
+	"""
+	Evaluates eval_preference for some (virtual, physical) pairs only, e.g. the candidate_pairs.
+	
+	Args:
+		virtual_positions (numpy.ndarray): An (V, 3) array of positions in meters.
+		phys_positions (numpy.ndarray): An (P, 3) array of positions in meters.
+		pairs (numpy.ndarray): A (K, 2) array of (virtual index, physical index) pairs.
+		radius (float): Distance in meters beyond which the preference is 0.
+	
+	Returns:
+		numpy.ndarray: The preference of every pair.
+	"""
+	pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+	diff = virtual_positions[pairs[:, 0]] - phys_positions[pairs[:, 1]]
+	return distance_to_preference(np.sqrt(np.einsum('ij,ij->i', diff, diff)), radius)
+
+
+def candidate_pairs(virtual_positions, phys_positions, radius, fallback_k=0):
+	"""
+	Finds the (virtual, physical) pairs closer than radius without computing every pairwise distance.
+	
+	Physical positions are bucketed into a grid of cubic cells with sides of length radius, so each virtual
+	position only needs to be compared against the physical positions in its own and the 26 neighboring cells.
+	Positions that are not finite (satellites that failed to propagate) are in no pair.
+	
+	Args:
+		virtual_positions (numpy.ndarray): An (V, 3) array of positions in meters.
+		phys_positions (numpy.ndarray): An (P, 3) array of positions in meters.
+		radius (float): Distance in meters within which a pair is a candidate.
+		fallback_k (int): Virtual satellites with fewer than fallback_k candidates within radius also get 
+				  their fallback_k nearest physical satellites as candidates, so they can still be assigned.
+	
+	Returns:
+		numpy.ndarray: A (K, 2) array of (virtual index, physical index) pairs, sorted.
+	"""
+	num_virtual, num_phys = len(virtual_positions), len(phys_positions)
+	virtual_ids = np.flatnonzero(np.isfinite(virtual_positions).all(axis=1))
+	phys_ids = np.flatnonzero(np.isfinite(phys_positions).all(axis=1))
+	if len(virtual_ids) < num_virtual or len(phys_ids) < num_phys:
+		# Pair the finite positions only, and map the pairs back to the original indices
+		pairs = candidate_pairs(virtual_positions[virtual_ids], phys_positions[phys_ids], radius, fallback_k)
+		return np.stack((virtual_ids[pairs[:, 0]], phys_ids[pairs[:, 1]]), axis=1)
+	if num_virtual == 0 or num_phys == 0:
+		return np.empty((0, 2), dtype=np.int64)
+
+	virtual_cells = np.floor(virtual_positions / radius).astype(np.int64)
+	phys_cells = np.floor(phys_positions / radius).astype(np.int64)
+
+	# Encode cells as single integers, padded by one cell on each side so neighbor cells never alias
+	low = np.minimum(virtual_cells.min(axis=0), phys_cells.min(axis=0)) - 1
+	dims = np.maximum(virtual_cells.max(axis=0), phys_cells.max(axis=0)) - low + 2
+	def cell_key(cells):
+		cells = cells - low
+		return (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+
+	order = np.argsort(cell_key(phys_cells), kind='stable')
+	sorted_keys = cell_key(phys_cells)[order]
+
+	virtual_idx = []
+	phys_idx = []
+	for offset in np.array(np.meshgrid([-1, 0, 1], [-1, 0, 1], [-1, 0, 1])).T.reshape(-1, 3):
+		keys = cell_key(virtual_cells + offset)
+		lo = np.searchsorted(sorted_keys, keys, side='left')
+		counts = np.searchsorted(sorted_keys, keys, side='right') - lo
+		total = counts.sum()
+		if total == 0:
+			continue
+		# Expand each virtual satellite's [lo, hi) range of sorted physical satellites
+		within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+		virtual_idx.append(np.repeat(np.arange(num_virtual), counts))
+		phys_idx.append(order[np.repeat(lo, counts) + within])
+
+	if virtual_idx:
+		virtual_idx = np.concatenate(virtual_idx)
+		phys_idx = np.concatenate(phys_idx)
+		diff = virtual_positions[virtual_idx] - phys_positions[phys_idx]
+		close = np.einsum('ij,ij->i', diff, diff) < radius ** 2
+		pairs = np.stack((virtual_idx[close], phys_idx[close]), axis=1)
+	else:
+		pairs = np.empty((0, 2), dtype=np.int64)
+
+	if fallback_k > 0:
+		num_candidates = np.bincount(pairs[:, 0], minlength=num_virtual)
+		short = np.flatnonzero(num_candidates < fallback_k)
+		if len(short):
+			k = min(fallback_k, num_phys)
+			distance = distance_matrix(virtual_positions[short], phys_positions)
+			nearest = np.argpartition(distance, k - 1, axis=1)[:, :k]
+			fallback = np.stack((np.repeat(short, k), nearest.ravel()), axis=1)
+			pairs = np.concatenate((pairs, fallback))
+
+	return np.unique(pairs, axis=0)
+
+
+class PreferenceCache:
+	"""
+	A cache of satellite states and virtual-to-physical preferences shared by the solver, 
+	the result printer and the visualizer.
+
+	States are keyed by satellite and epoch, and preference matrices by the satellites on both 
+	sides, the radius and the epoch, so each satellite is computed and each pair is evaluated 
+	at most once per run. Satellites are identified by caas_sim_propagation.satellite_key: their 
+	TLE lines, shared by a TleSatellite and its ephem object, or the orbital elements of 
+	generated satellites.
+	"""
+
+	def __init__(self):
+		self.states = {}
+		self.preferences = {}
+		self.hits = {'state': 0, 'preference': 0}
+		self.misses = {'state': 0, 'preference': 0}
+
+
+	def satellite_states(self, sats, epoch_str, allow_failed=False):
+		"""
+		Returns the states of the satellites at an epoch, computing only the ones not cached yet.
+		
+		Args:
+			sats (List[ephem.EarthSatellite]): The satellite objects.
+			epoch_str (str): The epoch time string.
+			allow_failed (bool): Return NaN states for the satellites that fail to propagate instead 
+					     of raising a ValueError naming them.
+		
+		Returns:
+			numpy.ndarray: An (N, 6) array of states, see satellite_states.
+		"""
+		keys = [(satellite_key(sat), epoch_str) for sat in sats]
+		missing = [k for k, key in enumerate(keys) if key not in self.states]
+		self.hits['state'] += len(keys) - len(missing)
+		self.misses['state'] += len(missing)
+		if missing:
+			computed = satellite_states([sats[k] for k in missing], epoch_str, allow_failed=True)
+			for k, state in zip(missing, computed):
+				self.states[keys[k]] = state
+		states = np.array([self.states[key] for key in keys]).reshape(len(keys), 6)
+		if not allow_failed:
+			failed = failed_satellites(states)
+			if len(failed):
+				raise ValueError(f"{len(failed)} satellites fail to propagate at {epoch_str}: "
+						 + ", ".join(satellite_name(sats[k], k) for k in failed.tolist()))
+		return states
+
+
+	def preference_matrix(self, virtual_sats, phys_sats, radius, epoch):
+		"""
+		Returns the (V, P) preference matrix of the satellites, see preference_matrix.
+		
+		Args:
+			virtual_sats (List[ephem.EarthSatellite]): The virtual satellite objects.
+			phys_sats (List[ephem.EarthSatellite]): The physical satellite objects.
+			radius (float): Distance in meters beyond which the preference is 0.
+			epoch (str): The epoch time string.
+		
+		Returns:
+			numpy.ndarray: A (V, P) array where entry [i, j] is the preference of virtual i for physical j.
+		"""
+		key = (tuple(map(satellite_key, virtual_sats)), tuple(map(satellite_key, phys_sats)), radius, epoch)
+		if key in self.preferences:
+			self.hits['preference'] += 1
+		else:
+			self.misses['preference'] += 1
+			distance = distance_matrix(self.satellite_states(virtual_sats, epoch)[:, :3],
+						   self.satellite_states(phys_sats, epoch)[:, :3])
+			self.preferences[key] = distance_to_preference(distance, radius)
+		return self.preferences[key]
+
+
+	def pair_preferences(self, virtual_sats, phys_sats, pairs, radius, epoch):
+		"""
+		Returns the preferences of some (virtual, physical) pairs, see pair_preferences. Unlike 
+		preference_matrix, the cost is proportional to the number of pairs.
+		
+		Args:
+			virtual_sats (List[ephem.EarthSatellite]): The virtual satellite objects.
+			phys_sats (List[ephem.EarthSatellite]): The physical satellite objects.
+			pairs (numpy.ndarray): A (K, 2) array of (virtual index, physical index) pairs.
+			radius (float): Distance in meters beyond which the preference is 0.
+			epoch (str): The epoch time string.
+		
+		Returns:
+			numpy.ndarray: The preference of every pair.
+		"""
+		return pair_preferences(self.satellite_states(virtual_sats, epoch)[:, :3],
+					self.satellite_states(phys_sats, epoch)[:, :3], pairs, radius)
+
+
+	def candidate_pairs(self, virtual_sats, phys_sats, radius, epoch, fallback_k=0):
+		"""
+		Returns the (virtual, physical) pairs closer than radius, see candidate_pairs.
+		
+		Args:
+			virtual_sats (List[ephem.EarthSatellite]): The virtual satellite objects.
+			phys_sats (List[ephem.EarthSatellite]): The physical satellite objects.
+			radius (float): Distance in meters within which a pair is a candidate.
+			epoch (str): The epoch time string.
+			fallback_k (int): Minimum number of candidates per virtual satellite.
+		
+		Returns:
+			numpy.ndarray: A (K, 2) array of (virtual index, physical index) pairs, sorted.
+		"""
+		return candidate_pairs(self.satellite_states(virtual_sats, epoch)[:, :3],
+				       self.satellite_states(phys_sats, epoch)[:, :3], radius, fallback_k)
+
+
+	def __str__(self):
+		return ", ".join("%s hits: %i, misses: %i" % (kind, self.hits[kind], self.misses[kind])
+				 for kind in self.hits)
+
+
+def preference_cache(data):
+	"""
+	Returns the PreferenceCache of a data model, creating it on first use.
+	
+	Args:
+		data (dict): The data model built by one of the create_data functions.
+	
+	Returns:
+		PreferenceCache: The cache shared by everything that reads the data model.
+	"""
+	if 'preference_cache' not in data:
+		data['preference_cache'] = PreferenceCache()
+	return data['preference_cache']
 
 
 def read_tles(filename_tles):
@@ -232,24 +653,12 @@ def read_tles(filename_tles):
 		List[dict]: A list of dictionaries, each satellite object the satellite's name.
 	"""
 	satellites = []
-	with open(filename_tles, 'r') as f:
-
-		for tles_line_1 in f:
-			tles_line_2 = f.readline()
-			tles_line_3 = f.readline()
-
-			# Retrieve name and identifier
-			name = tles_line_1
-			epoch_year = tles_line_2[18:20]
-			epoch_day = float(tles_line_2[20:32])
-			epoch = Time("20" + epoch_year + "-01-01 00:00:00", scale="tdb") + (epoch_day - 1) * u.day
-
-
-			# Store the satellite information
-			satellites.append({
-				'sat_obj':ephem.readtle(tles_line_1, tles_line_2, tles_line_3), 
-				'name' : name
-				})
+	for _, name, line1, line2 in tle_records([filename_tles]):
+		# Store the satellite information
+		satellites.append({
+			'sat_obj':ENGINE.read_tle(name, line1, line2), 
+			'name' : name
+			})
 	return satellites
 
 
@@ -286,108 +695,79 @@ def sat_setup(sat_dict, cur_sat):
 	cur_sat.range = sat_dict['range'] #int
 
 
-def const_setup(tles_files):
+def tle_satellite(name, line1, line2, lazy=True):
+	"""
+	Returns the satellite of a TLE as a TleSatellite, whose ephem object is built and validated on first use 
+	if lazy, or right away otherwise.
+	"""
+	sat = TleSatellite(name, line1, line2)
+	if not lazy:
+		sat.ephem  # reads and validates the TLE with ephem
+	return sat
+
+
+def const_setup(tles_files, lazy=True):
 	"""
 	Sets up the satellite constellation based on TLE (Two-Line Element) files.
 	
 	Parameters:
 	tles_files (list): A list of file paths to TLE files, each TLE file represent a constellation. 
+	lazy (bool): Whether to defer building the ephem objects until they are used, see tle_satellite.
 	
 	Returns:
-	tuple: A tuple containing a list of dictionary of satellite objects, name, and constellation ID,  and the number of constellations.
+	tuple: A tuple containing the Constellation of the satellites and the number of constellations.
 	"""
-	satellites = []
-	cid = 0
-	for each in tles_files:
-		with open(each, 'r') as f:
-			for tles_line_1 in f:
-				tles_line_2 = f.readline()
-				tles_line_3 = f.readline()
-				
-				name = tles_line_1.strip()
-				cur_ephem_sat = ephem.readtle(tles_line_1, tles_line_2, tles_line_3)
-				cur_sat = Satellite(cur_ephem_sat)
-
-				satellites.append({
-					'sat_obj':cur_sat, 
-					'name' : name,
-					'cid' : cid
-				})
-		cid += 1
-	return satellites, cid
-
-
-def const_setup_per_sat_config(tles_file, json_file):
+	satellites, names, cids = [], [], []
+	for cid, name, line1, line2 in tle_records(tles_files):
+		names.append(name)
+		satellites.append(tle_satellite(name, line1, line2, lazy))
+		cids.append(cid)
+	return Constellation(satellites, names, cids), len(tles_files)
+
+
+def const_setup_per_sat_config(tles_file, json_file, lazy=True):
 	"""
 	Sets up a satellite constellation based on TLE and per-satellite configuration files.
 	
 	Parameters:
 	tles_file (list): A list of TLE file paths, each TLE file represent a constellation. 
 	json_file (str): Path to the JSON file containing per-satellite configuration.
+	lazy (bool): Whether to defer building the ephem objects until they are used, see tle_satellite.
 	
 	Returns:
-	tuple: A tuple containing a list of dictionary of satellite objects, name, and constellation ID,  and the number of constellations.
+	tuple: A tuple containing the Constellation of the satellites and the number of constellations.
 	"""
-	satellites = []
-	cid = 0
+	satellites, names, cids, configs = [], [], [], []
 	sat_config = read_json(json_file)
-	i = 0
-	for each in tles_file:
-		with open(each, 'r') as f:
-			for tles_line_1 in f:
-				tles_line_2 = f.readline()
-				tles_line_3 = f.readline()
-
-				name = tles_line_1.strip()
-				cur_ephem_sat = ephem.readtle(tles_line_1, tles_line_2, tles_line_3)
-				cur_sat = Satellite(cur_ephem_sat)
-				sat_setup(sat_config[i], cur_sat)
-
-				satellites.append({
-					'sat_obj':cur_sat, 
-					'name' : name,
-					'cid' : cid
-				})
-			i +=1
-		cid += 1
-	return satellites, cid
-
-
-def const_setup_universal_config(tles_file, json_file):
+	for cid, name, line1, line2 in tle_records(tles_file):
+		names.append(name)
+		satellites.append(tle_satellite(name, line1, line2, lazy))
+		cids.append(cid)
+		configs.append(sat_config[cid])
+	return Constellation(satellites, names, cids, configs), len(tles_file)
+
+
+def const_setup_universal_config(tles_file, json_file, lazy=True):
 	"""
 	Sets up a satellite constellation based on TLE files and a universal satellite configuration.
 	
 	Parameters:
 	tles_file (list): A list of TLE file paths, each TLE file represent a constellation. 
 	json_file (str): A list of JSON file paths containing universal satellite configurations.
+	lazy (bool): Whether to defer building the ephem objects until they are used, see tle_satellite.
 	
 	Returns:
-	tuple: A tuple containing a list of dictionary of satellite objects, name, and constellation ID,  and the number of constellations.
+	tuple: A tuple containing the Constellation of the satellites and the number of constellations.
 	"""
-	satellites = []
-	cid = 0
-	with open(json_file[cid], 'r') as file:
+	satellites, names, cids = [], [], []
+	with open(json_file[0], 'r') as file:
 		sat_config = json.load(file)
-	for each in tles_file:
-		with open(each, 'r') as f:
-			for tles_line_1 in f:
-				tles_line_2 = f.readline()
-				tles_line_3 = f.readline()
-
-				name = tles_line_1.strip()
-				cur_ephem_sat = ephem.readtle(tles_line_1, tles_line_2, tles_line_3)
-				cur_sat = Satellite(cur_ephem_sat)
-				sat_setup(sat_config, cur_sat)
-				print(cur_sat.name)
+	for cid, name, line1, line2 in tle_records(tles_file):
+		names.append(name)
+		satellites.append(tle_satellite(name, line1, line2, lazy))
+		cids.append(cid)
 
-				satellites.append({
-					'sat_obj':cur_sat, 
-					'name' : name,
-					'cid' : cid
-				})
-		cid += 1
-
-	return satellites, cid
+	return Constellation(satellites, names, cids, [sat_config] * len(satellites)), len(tles_file)
 
 
 def satellite_ephem_to_str(satellite_ephem):
@@ -431,12 +811,15 @@ def generate_100_coordinates_around_europe():
 def create_data(virtual_tles, physical_tles):
 	# Create data with tles information about the virtual and physical constellations
 	data = {}
-	start_time = datetime.utcnow().replace(tzinfo=pytz.UTC) + timedelta(hours=1)
+	start_time = datetime.now(timezone.utc) + timedelta(hours=1)
 	data['epoch_str'] = start_time.strftime("%Y-%m-%d %H:%M:%S")
 
 	data["virtual"], data["num_virtual_const"] = const_setup(virtual_tles)
 	data["physical"], num_phys_const = const_setup(physical_tles)
 
+	data["preference_cache"] = PreferenceCache()
+	drop_failed_satellites(data)
+
 	data["virtual_list"] = list(range(len(data["virtual"])))
 	data["physical_list"] = list(range(len(data['physical'])))
 
@@ -447,12 +830,15 @@ def create_data_universal(virtual_tles, physical_tles, physical_json_file, virtu
 	# Create data with tles information about the virtual and physical constellations, 
 	# but uses universal config files for constellation setup
 	data = {}
-	start_time = datetime.utcnow().replace(tzinfo=pytz.UTC) + timedelta(hours=1)
+	start_time = datetime.now(timezone.utc) + timedelta(hours=1)
 	data['epoch_str'] = start_time.strftime("%Y-%m-%d %H:%M:%S")
 
 	data["virtual"], data["num_virtual_const"] = const_setup_universal_config(virtual_tles, virtual_json_files)
 	data["physical"], num_phys_const = const_setup_universal_config(physical_tles, physical_json_file)
 
+	data["preference_cache"] = PreferenceCache()
+	drop_failed_satellites(data)
+
 	data["virtual_list"] = list(range(len(data["virtual"])))
 	data["physical_list"] = list(range(len(data['physical'])))
 
@@ -462,18 +848,46 @@ def create_data_universal(virtual_tles, physical_tles, physical_json_file, virtu
 def create_data_per_sat(virtual_tles, physical_tles, virtual_json_file, physical_json_file):
 	# Create data per satellite (with individual config files for each satellite constellation)
 	data = {}
-	start_time = datetime.utcnow().replace(tzinfo=pytz.UTC) + timedelta(hours=1)
+	start_time = datetime.now(timezone.utc) + timedelta(hours=1)
 	data['epoch_str'] = start_time.strftime("%Y-%m-%d %H:%M:%S")
 
 	data["virtual"], data["num_virtual_const"] = const_setup_per_sat_config(virtual_tles, virtual_json_file)
 	data["physical"], num_phys_const = const_setup_per_sat_config(physical_tles, physical_json_file)
 
+	data["preference_cache"] = PreferenceCache()
+	drop_failed_satellites(data)
+
 	data["virtual_list"] = list(range(len(data["virtual"])))
 	data["physical_list"] = list(range(len(data['physical'])))
 
 	return data
 
 
+def drop_failed_satellites(data):
+	"""
+	Drops the satellites that fail to propagate at the data model's epoch (SGP4 errors, e.g. decayed 
+	orbits or TLEs too old for the epoch) from its constellations, and reports them. Their states stay 
+	in the preference cache, so the others are not propagated again.
+	
+	Args:
+		data (dict): The data model built by one of the create_data functions.
+	
+	Returns:
+		None
+	"""
+	cache = preference_cache(data)
+	for side in ('virtual', 'physical'):
+		constellation = data[side]
+		states = cache.satellite_states(constellation.satellites, data['epoch_str'], allow_failed=True)
+		failed = failed_satellites(states)
+		if len(failed):
+			print("Dropped %i %s satellites that fail to propagate at %s: %s" % (
+				len(failed), side, data['epoch_str'], ", ".join(constellation.names[k] for k in failed.tolist())))
+			keep = np.ones(len(constellation), dtype=bool)
+			keep[failed] = False
+			data[side] = constellation.subset(np.flatnonzero(keep))
+
+
 # Evaluate the preference of a virtual satellite to connect with a physical satellite based on distance
 def eval_preference(virtual_sat, phys_sat, radius, epoch):
 	distance = distance_m_between_satellites(virtual_sat, phys_sat, epoch, epoch)
@@ -487,23 +901,33 @@ def eval_sat_coordinate_distance(sat, lat, long):
 	return math.sqrt( (sat.sublat - lat) ** 2 + (sat.sublong - long) ** 2 )
 
 
-# Create a visualization string for virtual and physical satellites based on assignment data
+# Create a visualization string for virtual and physical satellites based on assignment data,
+# a {virtual index: physical index} dictionary
 def wrapper_visualize(data, assignment):
-	viz_string = ""
+	return "".join(wrapper_visualize_chunks(data, assignment))
+
+
+# Yields the visualization string of wrapper_visualize one entity at a time, so it can be written
+# out without holding the whole scene
+def wrapper_visualize_chunks(data, assignment):
+	cache = preference_cache(data)
+	virtual_states = cache.satellite_states(data['virtual'].satellites, data['epoch_str'])
+	physical_states = cache.satellite_states(data['physical'].satellites, data['epoch_str'])
+	virtual_cid = data['virtual'].cid.tolist()
 
 	# Loop through virtual satellites and generate visualization strings
 	for i in data['virtual_list']:
-		data['virtual'][i]["sat_obj"].compute(data['epoch_str'])
-		viz_string += "viewer.entities.add({name : '', position: Cesium.Cartesian3.fromDegrees(" \
-			+ str(math.degrees(data['virtual'][i]["sat_obj"].sublong)) + ", " \
-			+ str(math.degrees(data['virtual'][i]["sat_obj"].sublat)) + ", "\
-			+ str(data['virtual'][i]["sat_obj"].elevation) + "), "\
+		sublong, sublat, elevation = virtual_states[i, 3:]
+		entity = "viewer.entities.add({name : '', position: Cesium.Cartesian3.fromDegrees(" \
+			+ str(math.degrees(sublong)) + ", " \
+			+ str(math.degrees(sublat)) + ", "\
+			+ str(elevation) + "), "\
 			+ "ellipsoid : {radii : new Cesium.Cartesian3(" + str(SATELLITE_RADIUS) + ", " + str(SATELLITE_RADIUS) + ", " + str(SATELLITE_RADIUS) + "), "
 		
 		# Assign color based on constellation id (cid)
-		color = COLOR_LIST[data['virtual'][i]['cid']]
+		color = COLOR_LIST[virtual_cid[i]]
 		
-		viz_string += "material : Cesium.Color." + color + ".withAlpha(1),}});\n"
+		yield entity + "material : Cesium.Color." + color + ".withAlpha(1),}});\n"
 		
 
 	# Determine marker positions for physical satellites
@@ -515,31 +939,33 @@ def wrapper_visualize(data, assignment):
 	else:
 		MARKER_POS = list(x - (num_const / 2) + 0.5 for x in range(num_const)) # 0, 1 ->  -0.5, 0.5
 	
+	virt_per_phys = {}
+	for j in data['virtual_list']:
+		if j in assignment:
+			virt_per_phys.setdefault(assignment[j], []).append(j)
+
 	# Loop through physical satellites and generate visualization strings
 	for i in data['physical_list']:
-		data['physical'][i]["sat_obj"].compute(data['epoch_str'])
-		viz_string += "viewer.entities.add({name : '', position: Cesium.Cartesian3.fromDegrees(" \
-			+ str(math.degrees(data['physical'][i]["sat_obj"].sublong)) + ", " \
-			+ str(math.degrees(data['physical'][i]["sat_obj"].sublat)) + ", "\
-			+ str(data['physical'][i]["sat_obj"].elevation) + "), "\
+		sublong, sublat, elevation = physical_states[i, 3:]
+		yield "viewer.entities.add({name : '', position: Cesium.Cartesian3.fromDegrees(" \
+			+ str(math.degrees(sublong)) + ", " \
+			+ str(math.degrees(sublat)) + ", "\
+			+ str(elevation) + "), "\
 			+ 'billboard :{scale:1.5,\nimage:"data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAABAAAAAQCAYAAAAf8/9hAAAAAXNSR0IArs4c6QAAAARnQU1BAACxjwv8YQUAAAAJcEhZcwAADsMAAA7DAcdvqGQAAADJSURBVDhPnZHRDcMgEEMZjVEYpaNklIzSEfLfD4qNnXAJSFWfhO7w2Zc0Tf9QG2rXrEzSUeZLOGm47WoH95x3Hl3jEgilvDgsOQUTqsNl68ezEwn1vae6lceSEEYvvWNT/Rxc4CXQNGadho1NXoJ+9iaqc2xi2xbt23PJCDIB6TQjOC6Bho/sDy3fBQT8PrVhibU7yBFcEPaRxOoeTwbwByCOYf9VGp1BYI1BA+EeHhmfzKbBoJEQwn1yzUZtyspIQUha85MpkNIXB7GizqDEECsAAAAASUVORK5CYII=",}, '\
 			+ '});\n'
 
 
 		# Visualize assignment between virtual and physical satellites	
-		for j in data['virtual_list']:
-			if assignment[j, i].solution_value() > 0:
-				cur_virt_sat = data['virtual'][j]
-				color = COLOR_LIST[cur_virt_sat['cid']]
+		for j in virt_per_phys.get(i, []):
+			color = COLOR_LIST[virtual_cid[j]]
 
-				viz_string += "viewer.entities.add({name : '', position: Cesium.Cartesian3.fromDegrees(" \
-					+ str(math.degrees(data['physical'][i]["sat_obj"].sublong)) + ", " \
-					+ str(math.degrees(data['physical'][i]["sat_obj"].sublat) + MARKER_POS[cur_virt_sat['cid']]) + ", "\
-					+ str(data['physical'][i]["sat_obj"].elevation + MARKER_ELEVATION) + "), "\
-					+ "ellipsoid : {radii : new Cesium.Cartesian3("\
-					+ str(MARKER_RADIUS) + ", " + str(MARKER_RADIUS) + ", " + str(MARKER_RADIUS) + "), "
-				viz_string += "material : Cesium.Color." + color + ".withAlpha(1),}});\n"
-	return viz_string
+			entity = "viewer.entities.add({name : '', position: Cesium.Cartesian3.fromDegrees(" \
+				+ str(math.degrees(sublong)) + ", " \
+				+ str(math.degrees(sublat) + MARKER_POS[virtual_cid[j]]) + ", "\
+				+ str(elevation + MARKER_ELEVATION) + "), "\
+				+ "ellipsoid : {radii : new Cesium.Cartesian3("\
+				+ str(MARKER_RADIUS) + ", " + str(MARKER_RADIUS) + ", " + str(MARKER_RADIUS) + "), "
+			yield entity + "material : Cesium.Color." + color + ".withAlpha(1),}});\n"
 
 
 
@@ -565,7 +991,8 @@ def tle_file_parser(tle_files):
 
     This function reads a file containing multiple satellites' Two-Line Element (TLE)
     sets, where each set consists of a satellite name followed by two lines of orbital 
-    element data. It returns a structured representation of the satellite information.
+    element data. It returns a structured representation of the satellite information,
+    keeping only the first satellite of every orbital plane (see caas_sim_tle.PlaneIndex).
 
     Parameters:
     tle_file (str): The file path of the TLE file to be parsed.
@@ -574,45 +1001,92 @@ def tle_file_parser(tle_files):
     list of list: A list where each element corresponds to a satellite.
     """
     satellites = []
-    orbits = set()
+    planes = PlaneIndex()
 
     for tle_file in tle_files:
-        with open(tle_file, 'r') as f:
-            for title_line in f:
-                title_line = title_line.strip()
-                line_1 = f.readline()
-                line_2 = f.readline()
-                cur_orbit = extract_orbit(line_2)
-                
-                if len(orbits) == 0:
-                    satellites.append([title_line, line_1, line_2])
-                    orbits.add(cur_orbit)
-                elif cur_orbit not in orbits:  # remove overlapping orbits
-                    for orbit in orbits:
-                       if (abs(cur_orbit[0] - orbit[0]) < 1
-                            and abs(cur_orbit[1] - orbit[1]) < 1):
-                            break
-                    else:
-                        satellites.append([title_line, line_1, line_2])
-                        orbits.add(cur_orbit)
+        for records in stream_tle_file(tle_file):
+            for title_line, line_1, line_2, inclination, raan in zip(
+                    records['name'].tolist(), records['line1'].tolist(), records['line2'].tolist(),
+                    records['inclination'].tolist(), records['raan'].tolist()):
+                if planes.add(inclination, raan):  # remove overlapping orbits
+                    satellites.append([title_line.decode(), line_1.decode(), line_2.decode()])
     print('num orbits:', len(satellites))
                                 
     return satellites
 
 
-def orbit_czml(tle_file):
+def orbit_czml(*tle_files, precision=CZML_PRECISION, minify=CZML_MINIFY, compress=CZML_COMPRESS):
     """
     Generates a CZML string for visualizing satellite orbits.
 
     Parameters:
-    tle_file (list): A list of file paths containing TLE data.
+    tle_files (list): Lists of file paths containing TLE data, one per group of constellations
+        (e.g. the virtual and the physical ones). Overlapping orbits are removed within each
+        group, and the satellites of all the groups are drawn in one CZML document, each once.
+    precision (int): Number of decimals of the positions in meters (whole meters if 0, and
+        tens, hundreds... of meters if negative), full precision if None.
+    minify (bool): Whether to leave out the spaces of the JSON.
+    compress (bool): Whether to embed the CZML gzip compressed and base64 encoded, to be
+        decompressed by the gunzipJson function of html_templates/top.html.
 
     Returns:
     str: A JavaScript string that initializes the CZML data for use with CesiumJS to
          visualize the satellite orbits on a 3D globe.
     """
+    return "".join(orbit_czml_chunks(*tle_files, precision=precision, minify=minify, compress=compress))
 
-    single_tle = tle_file_parser(tle_file)
 
-    czml_string = satellite_czml(tle_list=single_tle).get_czml()
-    return "\nvar czml_data =" + czml_string + ";\nviewer.dataSources.add(Cesium.CzmlDataSource.load(czml_data));\n"
+def orbit_czml_chunks(*tle_files, precision=CZML_PRECISION, minify=CZML_MINIFY, compress=CZML_COMPRESS):
+    """
+    Yields the JavaScript string of orbit_czml in chunks, to be written out as they come.
+
+    Parameters:
+    tle_files (list): Lists of file paths containing TLE data, see orbit_czml.
+    precision, minify, compress: The output options of orbit_czml.
+
+    Yields:
+    str: The successive parts of the JavaScript string.
+    """
+    # imported here, as the CZML writer is only needed for the orbits
+    try:
+        from .satellite_czml import satellite_czml
+    except (ImportError, SystemError):
+        from satellite_czml import satellite_czml
+
+    single_tle = {}
+    for group in tle_files:
+        for tle in tle_file_parser(group):
+            single_tle.setdefault(int(tle[1][2:7]), tle)
+
+    czml_document = satellite_czml(tle_list=list(single_tle.values()), precision=precision)
+    czml_chunks = czml_document.iter_czml(minify=minify)
+    if compress:
+        yield "\nvar czml_data = gunzipJson(\""
+        yield from gzip_base64_chunks(czml_chunks)
+        yield "\");\nviewer.dataSources.add(czml_data.then(data => Cesium.CzmlDataSource.load(data)));\n"
+    else:
+        yield "\nvar czml_data ="
+        yield from czml_chunks
+        yield ";\nviewer.dataSources.add(Cesium.CzmlDataSource.load(czml_data));\n"
+
+
+def gzip_base64_chunks(chunks):
+    """
+    Compresses a string given in chunks with gzip and encodes it in base64, as it comes.
+
+    Parameters:
+    chunks (Iterable[str]): The parts of the string.
+
+    Yields:
+    str: The successive parts of the base64 encoding of the compressed string.
+    """
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    pending = b""
+    for chunk in chunks:
+        pending += compressor.compress(chunk.encode())
+        # base64 encodes 3 bytes at a time, the rest waits for the next chunk
+        whole = len(pending) - len(pending) % 3
+        if whole:
+            yield base64.b64encode(pending[:whole]).decode('ascii')
+            pending = pending[whole:]
+    yield base64.b64encode(pending + compressor.flush()).decode('ascii')
@@ -41,6 +41,7 @@ except ImportError:
 from datetime import date, datetime
 
 import dateutil.parser
+import numpy as np
 # from pygeoif import geometry
 # from pygeoif.geometry import as_shape as asShape
 from pytz import utc
@@ -68,6 +69,23 @@ def grouper(iterable, n, fillvalue=None):
     return izip_longest(*args, fillvalue=fillvalue)
 
 
+# edit: position samples are kept as flat float arrays instead of one
+# _Coordinate per sample
+def float_array(coords):
+    """Returns coords as a flat float array if it is a list, tuple or NumPy
+    array of numbers (nested lists and 2D arrays are flattened), None
+    otherwise. NumPy integer arrays keep their integers, which are written
+    without a fraction."""
+    if isinstance(coords, np.ndarray) and coords.dtype.kind in 'iu':
+        return coords.ravel()
+    if not isinstance(coords, (list, tuple, np.ndarray)):
+        return None
+    try:
+        return np.asarray(coords, dtype=float).ravel()
+    except (TypeError, ValueError):
+        return None
+
+
 def class_property(cls, name, doc=None):
     """Returns a property function that checks to be sure
     the value being assigned is a certain class before assigning it to a hidden
@@ -209,8 +227,17 @@ class CZML(_CZMLBaseObject):
             yield p.data()
 
     def dumps(self):
-        d = list(self.data())
-        return json.dumps(d)
+        return ''.join(self.iterencode())
+
+    def dump(self, fp, separators=None):
+        """Writes the document to the file-like object fp, one packet at
+        a time. """
+        dump_packets(self.packets, fp, separators)
+
+    def iterencode(self, separators=None):
+        """Yields the JSON string of the document in chunks, one per
+        packet, see iterencode_packets. """
+        return iterencode_packets(self.packets, separators)
 
     def load(self, data):
         self.packets = []
@@ -227,6 +254,29 @@ class CZML(_CZMLBaseObject):
         else:
             raise ValueError
 
+def iterencode_packets(packets, separators=None):
+    """Encodes packets as the JSON array of a CZML document, yielding the
+    string of one packet at a time. packets can be any iterable of
+    CZMLPacket, e.g. a generator building them on demand, so the packets,
+    their data and the document string are never held whole. The chunks
+    join to the string json.dumps gives for the list of the packets' data,
+    with the same separators, e.g. (',', ':') for minified JSON.
+    """
+    item_separator = separators[0] if separators else ', '
+    separator = '['
+    for packet in packets:
+        yield separator + json.dumps(packet.data(), separators=separators)
+        separator = item_separator
+    yield '[]' if separator == '[' else ']'
+
+
+def dump_packets(packets, fp, separators=None):
+    """Writes packets as a CZML document to the file-like object fp, see
+    iterencode_packets. """
+    for chunk in iterencode_packets(packets, separators):
+        fp.write(chunk)
+
+
 class _DateTimeAware(_CZMLBaseObject):
     """ A baseclass for Date time aware objects """
 
@@ -279,9 +329,15 @@ class _Coordinate(object):
 class _Coordinates(object):
 
     coords = None
+    # edit: [X, Y, Z] or [Time, X, Y, Z, ...] numbers, as one float array
+    values = None
 
     def __init__(self, coords):
-        if isinstance(coords, (list, tuple)):
+        values = float_array(coords)
+        if values is not None and (len(values) == 3 or
+                                   (len(values) >= 4 and len(values) % 4 == 0)):
+            self.values = values
+        elif isinstance(coords, (list, tuple)):
             try:
                 float(coords[1])
                 if len(coords) < 3:
@@ -307,6 +363,8 @@ class _Coordinates(object):
                 self.coords = [_Coordinate(*geom.coords[0])]
 
     def data(self):
+        if self.values is not None:
+            return self.values.tolist()
         d = []
         if self.coords:
             for coord in self.coords:
@@ -375,6 +433,8 @@ class Position(_DateTimeAware):
         are time-tagged samples arranged as
         [Time, X, Y, Z, Time, X, Y, Z, Time, X, Y, Z, ...],
         where Time is an ISO 8601 date and time string or seconds since epoch.
+        Numbers can be given as a list or a NumPy array, e.g. of shape (N, 4),
+        and are kept as one flat float array.
         """
         return self._cartesian
 
@@ -691,7 +751,13 @@ class _Positions(object):
     coords = None
 
     def __init__(self, coords):
-        if isinstance(coords, (list, tuple)):
+        if isinstance(coords, np.ndarray):
+            # edit: NumPy arrays are kept as flat float arrays
+            coords = float_array(coords)
+            assert(len(coords) % 3 == 0)
+            assert(len(coords) >= 6)
+            self.coords = coords
+        elif isinstance(coords, (list, tuple)):
             assert(len(coords) % 3 == 0)
             assert(len(coords) >= 6)
             for coord in coords:
@@ -715,6 +781,8 @@ class _Positions(object):
                         raise ValueError
 
     def data(self):
+        if isinstance(self.coords, np.ndarray):
+            return self.coords.tolist()
         return self.coords
 
 
@@ -1,8 +1,6 @@
 #!/bin/bash
 pip install ortools
 pip install numpy
-pip install geopy
-pip install astropy
 pip install ephem
 pip install geometry
 pip install satellite
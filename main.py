@@ -1,29 +1,76 @@
-try:
-	from . import caas_sim_utils
-	from . import caas_sim_solver
-except (ImportError, SystemError):
-	import caas_sim_utils
-	import caas_sim_solver
+import argparse
+import importlib
+import os
+import time
+
+# Input paths are relative to this file, so runs from any directory find them
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Paths to html template files
-topFile = "./html_templates/top.html"
-bottomFile = "./html_templates/bottom.html"
+topFile = os.path.join(BASE_DIR, "html_templates/top.html")
+bottomFile = os.path.join(BASE_DIR, "html_templates/bottom.html")
 
 # Paths to files describing physical constellation
-physical_files = ['tles/STARLINK-PT1.txt'] # array of paths to the tles files, each file represent one constellation
-physical_json_file = ['json/uni_config_phy.json'] # array of paths to the config files
+physical_files = [os.path.join(BASE_DIR, 'tles/STARLINK-PT1.txt')] # array of paths to the tles files, each file represent one constellation
+physical_json_file = [os.path.join(BASE_DIR, 'json/uni_config_phy.json')] # array of paths to the config files
 
 # Paths to files describing virtual constellation demand
-virtual_files = ['tles/STARLINK_virt1.txt', 'tles/STARLINK_virt2.txt'] # array of paths to the tles files, each file represent one constellation
-virtual_json_files = ['json/uni_config_virt1.json', 'json/uni_config_virt2.json'] # array of paths to the config files
+virtual_files = [os.path.join(BASE_DIR, 'tles/STARLINK_virt1.txt'), os.path.join(BASE_DIR, 'tles/STARLINK_virt2.txt')] # array of paths to the tles files, each file represent one constellation
+virtual_json_files = [os.path.join(BASE_DIR, 'json/uni_config_virt1.json'), os.path.join(BASE_DIR, 'json/uni_config_virt2.json')] # array of paths to the config files
 
-# Validate and create constellation
-test_data = caas_sim_utils.create_data_universal(virtual_files, physical_files, physical_json_file, virtual_json_files)
+# Output Cesium based HTML file that visualizes the solver output
+OUT_HTML_FILE = 'sat_wrapper_test_viz.html'
 
-# Generate a schole based on optimization rules and goals configured in caas_sim_solver.py
-viz_string_wrap = caas_sim_solver.solve_sat_wrapper(test_data, virtual_files, physical_files)
+# Modules imported at startup, each after the ones it depends on, so each time of the breakdown is what the
+# module adds to the ones before. ortools and the CZML writer are imported later, by the code that uses them.
+STARTUP_MODULES = ('numpy', 'ephem', 'sgp4.api', 'caas_sim_tle', 'caas_sim_propagation', 'caas_sim_utils',
+		   'caas_sim_backends', 'caas_sim_solver')
 
 
-# Output Cesium based HTML file that visualizes the solver output
-OUT_HTML_FILE = 'sat_wrapper_test_viz.html'
-caas_sim_utils.write_viz_files(viz_string_wrap, topFile, bottomFile, OUT_HTML_FILE)
\ No newline at end of file
+def import_module(name):
+	if __package__ and name.startswith('caas_sim_'):
+		return importlib.import_module('.' + name, __package__)
+	return importlib.import_module(name)
+
+
+def import_startup_modules():
+	"""
+	Imports STARTUP_MODULES in order.
+
+	Returns:
+		List[tuple]: The name of every module and the milliseconds its import took.
+	"""
+	times = []
+	for name in STARTUP_MODULES:
+		start = time.perf_counter()
+		import_module(name)
+		times.append((name, (time.perf_counter() - start) * 1000))
+	return times
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Assigns the virtual constellations to the physical one and '
+						     'writes the Cesium visualization of the assignment.')
+	parser.add_argument('--import-times', action='store_true', help='print how long each module took to import')
+	args = parser.parse_args(argv)
+
+	import_times = import_startup_modules()
+	if args.import_times:
+		for name, milliseconds in import_times:
+			print("Import %-22s %6.1f milliseconds" % (name, milliseconds))
+		print("Import total %22.1f milliseconds" % sum(milliseconds for _, milliseconds in import_times))
+	caas_sim_utils = import_module('caas_sim_utils')
+	caas_sim_solver = import_module('caas_sim_solver')
+
+	# Validate and create constellation
+	test_data = caas_sim_utils.create_data_universal(virtual_files, physical_files, physical_json_file, virtual_json_files)
+
+	# Generate a schole based on optimization rules and goals configured in caas_sim_solver.py
+	viz_chunks = caas_sim_solver.solve_sat_wrapper_chunks(test_data, virtual_files, physical_files)
+
+	# Output Cesium based HTML file that visualizes the solver output, written as it is generated
+	caas_sim_utils.write_viz_files(viz_chunks, topFile, bottomFile, OUT_HTML_FILE)
+
+
+if __name__ == '__main__':
+	main()
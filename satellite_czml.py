@@ -2,17 +2,46 @@
 # Author: Nicholas Miller (miller.nicholas.a@gmail.com)
 # https://github.com/cassova/satellite-czml
 
-from czml import (CZML, Billboard, CZMLPacket, Description, Label,
-                   Path, Position, Point)
-from sgp4.earth_gravity import wgs72
-from sgp4.io import twoline2rv
+from czml import (Billboard, CZMLPacket, Description, Label,
+                  Path, Position, Point, dump_packets, iterencode_packets)
+from sgp4.api import jday
+from caas_sim_propagation import ENGINE
 
 from datetime import datetime, timedelta
 import pytz
 import random
 import math
 
+import numpy as np
 
+# JSON separators of minified CZML
+MINIFIED_SEPARATORS = (',', ':')
+
+
+def sample_times(start_time, end_time, step=300):
+    '''
+    Returns the offsets in seconds from start_time of the position samples
+    and their Julian dates, split in whole (jd) and fractional (fr) arrays
+    '''
+    number_of_positions = int((end_time - start_time).total_seconds()/300)
+    number_of_positions += 5 # so there is more than 1
+
+    time_steps = [k * step for k in range(number_of_positions)]
+    jd = np.empty(number_of_positions)
+    fr = np.empty(number_of_positions)
+    for k, time_step in enumerate(time_steps):
+        current_time = start_time + timedelta(seconds=time_step)
+        jd[k], fr[k] = jday(current_time.year, current_time.month, current_time.day,
+                            current_time.hour, current_time.minute, current_time.second)
+    return time_steps, jd, fr
+
+def propagate_positions(tle_objects, start_time, end_time, step=300):
+    '''
+    Propagates satellites over all sample times of a range in one vectorized
+    call. Returns an (N, T, 3) array of positions in meters
+    '''
+    _, jd, fr = sample_times(start_time, end_time, step)
+    return ENGINE.positions(tle_objects, jd, fr)
 
 
 class satellite():
@@ -86,7 +115,7 @@ class satellite():
         if end_time is not None:
             self.end_time = end_time
 
-        self.tle_obj = twoline2rv(self.tle[0], self.tle[1], wgs72)
+        self.tle_obj = ENGINE.tle_propagator(self.tle[0], self.tle[1])
 
     def __check_tle_for_names(self, tle):
         '''
@@ -221,9 +250,17 @@ class satellite():
                        referenceFrame = "INERTIAL",
                        tle_object=None,
                        step=300,
-                       rebuild=False):
-        '''
-        Creates the satellite positions and settings
+                       positions=None,
+                       rebuild=False,
+                       precision=None):
+        '''
+        Creates the satellite positions and settings. positions are the (T, 3) positions
+        in meters at the sample_times of the range, if already propagated in a batch
+        (see propagate_positions), otherwise the TLE is propagated here. Samples that
+        fail to propagate are left out. precision is
+        the number of decimals the positions are rounded to (whole meters, written
+        as integers, if 0, and tens, hundreds... of meters if negative), full
+        precision if None
         '''
         start_time = start_time or self.start_time
         end_time = end_time or self.end_time
@@ -236,23 +273,22 @@ class satellite():
             self.czmlPosition.referenceFrame = referenceFrame
             self.czmlPosition.epoch = start_time.isoformat()
 
-            number_of_positions = int((end_time - start_time).total_seconds()/300)
-            number_of_positions += 5 # so there is more than 1
-            time_step=0
-
-            positions=[]
-            for _ in range(number_of_positions):
-                current_time = start_time + timedelta(seconds=time_step)
-                eci_position, _ = tle_object.propagate(current_time.year, current_time.month,
-                                                       current_time.day, current_time.hour,
-                                                       current_time.minute, current_time.second)
-
-                positions.append(time_step)
-                positions.append(eci_position[0] * 1000)  # converts km's to m's
-                positions.append(eci_position[1] * 1000)
-                positions.append(eci_position[2] * 1000)
-                time_step += step
-            self.czmlPosition.cartesian = positions
+            if positions is None:
+                _, jd, fr = sample_times(start_time, end_time, step)
+                _, eci_positions, _ = tle_object.sgp4_array(jd, fr)
+                positions = eci_positions * 1000  # converts km's to m's
+
+            # [Time, X, Y, Z] rows, flattened by Position. The samples SGP4 fails
+            # to propagate (NaN) are left out, no samples left leaves no cartesian
+            cartesian = np.empty((len(positions), 4))
+            cartesian[:, 0] = np.arange(len(positions)) * step
+            cartesian[:, 1:] = positions
+            cartesian = cartesian[np.isfinite(cartesian).all(axis=1)]
+            if precision is not None:
+                cartesian = np.round(cartesian, precision)
+                if precision <= 0:
+                    cartesian = cartesian.astype(np.int64)
+            self.czmlPosition.cartesian = cartesian if len(cartesian) else None
         return self.czmlPosition
 
     def get_orbital_time(self):
@@ -376,17 +412,21 @@ class satellite_czml():
     default_seed = 0
     ignore_bad_tles=False
 
-    satellites = {}
-
     def __init__(self, tle_list=None, satellite_list=None, start_time=None, end_time=None,
                  name_list=None, description_list=None, color_list=None, image_list=None,
                  use_default_image=True, marker_scale_list=None, speed_multiplier=None,
                  show_label=True, show_path=True, use_utc=True, seed=None,
-                 ignore_bad_tles=False):
+                 ignore_bad_tles=False, precision=None):
         '''
-        Initialize satellite_czml object
+        Initialize satellite_czml object. precision is the number of decimals of
+        the positions, see satellite.build_position
         '''
 
+        self.precision = precision
+
+        # The satellites of this document, by id
+        self.satellites = {}
+
         # Set the seed now before we generate colors
         self.set_seed(seed)
 
@@ -496,24 +536,64 @@ class satellite_czml():
         random.seed(seed or self.default_seed)
         return True
 
+    def build_positions(self, step=300):
+        '''
+        Propagates every satellite of the document's time range that has no
+        positions yet in one batch
+        '''
+        pending = [sat for sat in self.satellites.values()
+                   if sat.czmlPosition is None
+                   and sat.start_time == self.start_time and sat.end_time == self.end_time]
+        positions = propagate_positions([sat.tle_obj for sat in pending],
+                                        self.start_time, self.end_time, step)
+        for sat, sat_positions in zip(pending, positions):
+            sat.build_position(step=step, positions=sat_positions, precision=self.precision)
+        return True
+
     def get_czml(self):
         '''
         Returns a CZML string
         '''
+        return ''.join(self.iter_czml())
+
+    def iter_czml(self, minify=False):
+        '''
+        Yields the CZML string of get_czml one packet at a time, building each
+        packet only when it is encoded, so the document is never held whole.
+        minify leaves out the spaces after separators
+        '''
+        return iterencode_packets(self.packets(), MINIFIED_SEPARATORS if minify else None)
+
+    def dump_czml(self, fp, minify=False):
+        '''
+        Writes the CZML document to the file-like object fp, see iter_czml
+        '''
+        dump_packets(self.packets(), fp, MINIFIED_SEPARATORS if minify else None)
+
+    def packets(self):
+        '''
+        Yields the CZML packets of the document: the document packet,
+        then one packet per satellite. Satellites that fail to propagate
+        over the whole time range are left out, and reported
+        '''
+        self.build_positions()
 
         # Initialize the CZML document
         interval = self.start_time.isoformat() + "/" + self.end_time.isoformat()
-        doc = CZML()
         packet = CZMLPacket(id='document', version='1.0')
         packet.clock = {"interval": interval,
                         "currentTime": self.start_time.isoformat(),
                         "multiplier": self.speed_multiplier,
                         "range": "LOOP_STOP",
                         "step": "SYSTEM_CLOCK_MULTIPLIER"}
-        doc.packets.append(packet)
+        yield packet
 
         # Add each satellite
+        skipped = []
         for id, sat in self.satellites.items():
+            if sat.build_position().cartesian is None:
+                skipped.append(sat.name)
+                continue
             # Initialize satellite CZML data
             try:
                 sat_packet = CZMLPacket(id=id)
@@ -527,10 +607,11 @@ class satellite_czml():
                 sat_packet.label = sat.build_label()
                 sat_packet.path = sat.build_path()
                 sat_packet.position = sat.build_position()
-
-                doc.packets.append(sat_packet)
             except Exception as e:
                 if not self.ignore_bad_tles:
                     raise Exception(f'Failed to generate CZML for satellite ID {id}: {sat.name}\nError:\n{e}')
-
-        return str(doc)
\ No newline at end of file
+                continue
+            yield sat_packet
+        if skipped:
+            print(f'Skipped {len(skipped)} satellites that fail to propagate from {self.start_time} '
+                  f'to {self.end_time}: {", ".join(skipped)}')
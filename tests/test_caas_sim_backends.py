@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+
+from caas_sim_backends import INFEASIBLE, MAX_CAPACITY_SCALE, OPTIMAL, integer_capacities, solve
+from caas_sim_solver import AssignmentModel
+from caas_sim_utils import Constellation
+
+EXACT_BACKENDS = ['scip', 'cpsat', 'flow']
+
+
+def constellation(configs):
+	# Models only read the fields and the number of satellites, so no orbits are needed
+	return Constellation([None] * len(configs), ['sat%i' % k for k in range(len(configs))],
+			     np.zeros(len(configs)), configs)
+
+
+def assignment_model(virtual_configs, physical_configs, preference, pairs=None):
+	data = {'virtual': constellation(virtual_configs), 'physical': constellation(physical_configs)}
+	return AssignmentModel(data, np.asarray(preference, dtype=float), pairs)
+
+
+def random_model(seed, num_virtual=10, num_physical=6, demand=5, capacity=10, density=0.5):
+	# Every virtual satellite has the same CPU demand, so min cost flow applies and capacities are slots
+	rng = np.random.default_rng(seed)
+	pairs = np.argwhere(rng.random((num_virtual, num_physical)) < density)
+	return assignment_model([{'CPU': demand}] * num_virtual, [{'CPU': capacity}] * num_physical,
+				rng.random((num_virtual, num_physical)), pairs)
+
+
+def check_feasible(model, assignment):
+	pairs = set(zip(model.pair_virtual.tolist(), model.pair_physical.tolist()))
+	assert sorted(assignment) == list(range(model.num_virtual))
+	assert all(pair in pairs for pair in assignment.items())
+	virtual = np.array(list(assignment), dtype=np.int64)
+	physical = np.array(list(assignment.values()), dtype=np.int64)
+	for f in range(len(model.fields)):
+		load = np.bincount(physical, weights=model.demand[f, virtual], minlength=model.num_physical)
+		assert np.all(load <= model.capacity[f] + 1e-9)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_exact_backends_agree(seed):
+	model = random_model(seed)
+	results = {backend: solve(model, backend) for backend in EXACT_BACKENDS}
+	assert len({result.status for result in results.values()}) == 1
+	for result in results.values():
+		if result.found:
+			assert result.status == OPTIMAL
+			check_feasible(model, result.assignment)
+			# CP-SAT and min cost flow optimize preferences rounded to 1 / PREFERENCE_SCALE
+			assert result.objective == pytest.approx(results['scip'].objective, abs=1e-4)
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_greedy_feasible_whenever_exact_is(seed):
+	# 12 slots for 10 virtual satellites, too tight for placing the best pairs first without repair
+	model = random_model(seed)
+	exact = solve(model, 'scip')
+	greedy = solve(model, 'greedy')
+	assert greedy.found == exact.found
+	if greedy.found:
+		check_feasible(model, greedy.assignment)
+		assert greedy.objective <= exact.objective + 1e-9
+
+
+def test_greedy_repairs_large_tight_model():
+	model = random_model(2, num_virtual=300, num_physical=60, demand=5, capacity=26, density=0.1)
+	assert solve(model, 'flow').found
+	greedy = solve(model, 'greedy')
+	assert greedy.found
+	check_feasible(model, greedy.assignment)
+
+
+def test_integer_capacities_are_exact_for_decimal_fractions():
+	demand, capacity = integer_capacities(np.array([0.5, 0.25, 1.0]), np.array([1.5, np.inf, 0.75]))
+	assert demand.tolist() == [50, 25, 100]
+	assert capacity.tolist() == [150, np.inf, 75]
+
+
+def test_integer_capacities_round_towards_feasible():
+	# 1/3 has no exact scale: demands round up and capacities down, so two thirds no longer fit in 2/3
+	demand, capacity = integer_capacities(np.array([1 / 3]), np.array([2 / 3]))
+	assert demand.tolist() == [MAX_CAPACITY_SCALE // 3 + 1]
+	assert capacity.tolist() == [2 * MAX_CAPACITY_SCALE // 3]
+
+
+@pytest.mark.parametrize('demand,capacity,fits', [(0.3, 0.9, 3), (0.25, 1.0, 4), (0.125, 0.5, 4), (1.5, 4.0, 2)])
+def test_fractional_demands_fill_capacity_exactly(demand, capacity, fits):
+	# Every virtual satellite prefers physical satellite 0, which has room for exactly fits of them
+	num_virtual = fits + 2
+	preference = np.tile([1.0, 0.5], (num_virtual, 1))
+	model = assignment_model([{'CPU': demand}] * num_virtual, [{'CPU': capacity}, {'CPU': num_virtual * demand}],
+				 preference)
+	for backend in ['scip', 'cpsat']:
+		result = solve(model, backend)
+		assert result.status == OPTIMAL
+		check_feasible(model, result.assignment)
+		assert list(result.assignment.values()).count(0) == fits
+		assert result.objective == pytest.approx(fits + 0.5 * (num_virtual - fits))
+
+
+def test_missing_capability_is_infeasible():
+	virtual = [{'CPU': 1}, {'CPU': 1, 'GPU': True}, {'CPU': 1}]
+	physical = [{'CPU': 2, 'rgb': True}, {'CPU': 2}]
+	model = assignment_model(virtual, physical, np.ones((3, 2)))
+	# No physical satellite has a GPU, so virtual satellite 1 has no pair left
+	assert 1 not in model.pair_virtual.tolist()
+	for backend in EXACT_BACKENDS:
+		assert solve(model, backend).status == INFEASIBLE
+	assert not solve(model, 'greedy').found
+
+
+def test_capability_restricts_pairs():
+	virtual = [{'CPU': 1, 'GPU': True}, {'CPU': 1}]
+	physical = [{'CPU': 2}, {'CPU': 2, 'GPU': True}]
+	model = assignment_model(virtual, physical, [[1.0, 0.1], [0.2, 0.9]])
+	assert sorted(zip(model.pair_virtual.tolist(), model.pair_physical.tolist())) == [(0, 1), (1, 0), (1, 1)]
+	for backend in EXACT_BACKENDS + ['greedy']:
+		assert solve(model, backend).assignment == {0: 1, 1: 1}
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from caas_sim_tle import PlaneIndex
+
+
+def brute_force_planes(planes, tolerance):
+	"""
+	Keeps every plane that is not within the tolerance of a plane kept before it, comparing it to all of them.
+	"""
+	kept = []
+	added = []
+	for inclination, raan in planes:
+		raan %= 360
+		for other_inclination, other_raan in kept:
+			raan_distance = abs(raan - other_raan)
+			if abs(inclination - other_inclination) < tolerance and min(raan_distance, 360 - raan_distance) < tolerance:
+				added.append(False)
+				break
+		else:
+			kept.append((inclination, raan))
+			added.append(True)
+	return added
+
+
+@pytest.mark.parametrize('tolerance', [0.3, 1.0, 7.0, 100.0, 400.0])
+def test_plane_index_matches_brute_force(tolerance):
+	rng = np.random.default_rng(17)
+	# RAANs beyond [0, 360) and bunched around 0, so planes are compared across the wrap-around
+	planes = np.column_stack((rng.uniform(50, 60, 3000),
+				  np.concatenate((rng.uniform(-20, 380, 2000), rng.uniform(-2, 2, 1000)))))
+	index = PlaneIndex(tolerance)
+	added = [index.add(inclination, raan) for inclination, raan in planes.tolist()]
+	assert added == brute_force_planes(planes.tolist(), tolerance)
+	assert len(index) == sum(added)
+
+
+def test_plane_index_raan_wraps_around():
+	index = PlaneIndex(1.0)
+	assert index.add(53.0, 359.5)
+	assert not index.add(53.2, 0.2)
+	assert not index.add(53.0, -0.3)
+	assert index.add(53.0, 1.6)
+	assert index.add(54.5, 359.5)
+	assert len(index) == 3
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from caas_sim_utils import candidate_pairs, distance_matrix, distance_to_preference, pair_preferences
+
+RADIUS = 2000000.0
+
+
+def random_positions(rng, count):
+	# Positions on shells at orbital altitudes, in meters
+	directions = rng.normal(size=(count, 3))
+	directions /= np.linalg.norm(directions, axis=1)[:, None]
+	return directions * rng.uniform(6.7e6, 7.5e6, (count, 1))
+
+
+def pair_set(pairs):
+	return {tuple(pair) for pair in pairs.tolist()}
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_candidate_pairs_match_brute_force(seed):
+	rng = np.random.default_rng(seed)
+	virtual, physical = random_positions(rng, 300), random_positions(rng, 400)
+	pairs = candidate_pairs(virtual, physical, RADIUS)
+	assert pair_set(pairs) == pair_set(np.argwhere(distance_matrix(virtual, physical) < RADIUS))
+	assert np.array_equal(pairs, np.unique(pairs, axis=0))
+
+
+@pytest.mark.parametrize('fallback_k', [1, 3, 10])
+def test_candidate_pairs_fallback(fallback_k):
+	rng = np.random.default_rng(4)
+	virtual, physical = random_positions(rng, 200), random_positions(rng, 50)
+	distance = distance_matrix(virtual, physical)
+	within = pair_set(np.argwhere(distance < RADIUS / 4))
+	pairs = pair_set(candidate_pairs(virtual, physical, RADIUS / 4, fallback_k))
+	assert within <= pairs
+	for i in range(len(virtual)):
+		candidates = {j for v, j in pairs if v == i}
+		if sum(1 for v, _ in within if v == i) < fallback_k:
+			nearest = set(np.argsort(distance[i], kind='stable')[:fallback_k].tolist())
+			assert nearest <= candidates
+		assert len(candidates) >= fallback_k
+
+
+def test_candidate_pairs_skip_non_finite_positions():
+	rng = np.random.default_rng(5)
+	virtual, physical = random_positions(rng, 100), random_positions(rng, 120)
+	virtual[[3, 40]] = np.nan
+	physical[[0, 119]] = np.inf
+	pairs = candidate_pairs(virtual, physical, RADIUS, fallback_k=3)
+	assert not set(pairs[:, 0].tolist()) & {3, 40}
+	assert not set(pairs[:, 1].tolist()) & {0, 119}
+	with np.errstate(invalid='ignore'):
+		expected = pair_set(np.argwhere(distance_matrix(virtual, physical) < RADIUS))
+	assert expected <= pair_set(pairs)
+
+
+def test_pair_preferences_match_preference_matrix():
+	rng = np.random.default_rng(6)
+	virtual, physical = random_positions(rng, 80), random_positions(rng, 90)
+	pairs = candidate_pairs(virtual, physical, RADIUS, fallback_k=2)
+	dense = distance_to_preference(distance_matrix(virtual, physical), RADIUS)
+	assert np.allclose(pair_preferences(virtual, physical, pairs, RADIUS), dense[pairs[:, 0], pairs[:, 1]])
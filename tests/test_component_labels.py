@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from caas_sim_backends import component_labels
+
+
+def random_model(rng, num_virtual, num_physical, num_pairs):
+	pairs = np.unique(np.column_stack((rng.integers(0, num_virtual, num_pairs), rng.integers(0, num_physical, num_pairs))), axis=0)
+	return SimpleNamespace(num_virtual=num_virtual, num_physical=num_physical,
+		pair_virtual=pairs[:, 0], pair_physical=pairs[:, 1])
+
+
+def brute_force_components(model):
+	# Depth-first search over virtual nodes 0..V-1 and physical nodes V..V+P-1
+	count = model.num_virtual + model.num_physical
+	neighbours = [[] for _ in range(count)]
+	for i, j in zip(model.pair_virtual.tolist(), model.pair_physical.tolist()):
+		neighbours[i].append(j + model.num_virtual)
+		neighbours[j + model.num_virtual].append(i)
+	component = [None] * count
+	for start in range(count):
+		if component[start] is None:
+			component[start] = start
+			stack = [start]
+			while stack:
+				for node in neighbours[stack.pop()]:
+					if component[node] is None:
+						component[node] = start
+						stack.append(node)
+	return component
+
+
+def partition(labels):
+	groups = {}
+	for node, label in enumerate(labels):
+		groups.setdefault(label, set()).add(node)
+	return {frozenset(group) for group in groups.values()}
+
+
+@pytest.mark.parametrize('seed,num_pairs', [(0, 0), (1, 20), (2, 80), (3, 150), (4, 400)])
+def test_component_labels_match_brute_force(seed, num_pairs):
+	rng = np.random.default_rng(seed)
+	model = random_model(rng, 120, 90, num_pairs)
+	virtual_labels, physical_labels = component_labels(model)
+	assert len(virtual_labels) == model.num_virtual and len(physical_labels) == model.num_physical
+	labels = np.concatenate((virtual_labels, physical_labels)).tolist()
+	assert partition(labels) == partition(brute_force_components(model))
+
+
+def test_component_labels_long_chain():
+	# A path alternating virtual and physical satellites in reverse order needs many propagation rounds
+	n = 200
+	order = np.arange(n)[::-1]
+	model = SimpleNamespace(num_virtual=n, num_physical=n,
+		pair_virtual=np.concatenate((order, order[1:])), pair_physical=np.concatenate((order, order[:-1])))
+	virtual_labels, physical_labels = component_labels(model)
+	assert len(set(virtual_labels.tolist()) | set(physical_labels.tolist())) == 1